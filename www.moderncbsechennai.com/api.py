@@ -1,21 +1,40 @@
 # api.py
 import os
 import json
-import math
 import re
 import random
 import logging
 import hashlib
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from google.cloud import storage
 from fastapi import HTTPException
 
+from context_builder import CONTEXT_CANDIDATES, SYSTEM_PREFIX, build_context, user_prompt, warm_tokenizer
+from emotion import EmotionClassifier
+from faq import FAQEngine, normalize_question
+from governor import deadline, governor, governor_stats
+from fees import FeeEngine
+from intent_router import Route, route_query
+from math_engine import MathEngine
+from query_classifier import math_expression
+from response_cache import ResponseCache, is_conversational, make_key
+from session_state import Session, SessionStore
+from singleflight import SingleFlight
+from snapshot import SNAPSHOT_PREFIX
+
+_PROCESS_START = time.monotonic()
+
 DASHBOARD_PASSWORD = os.getenv("DASHBOARD_PASSWORD", "modernSchool2025")
 
 def check_password(pw: str):
@@ -72,20 +91,38 @@ def env(name: str, default: str | None = None) -> str | None:
 
 GOOGLE_CLOUD_PROJECT = env("GOOGLE_CLOUD_PROJECT", DEFAULT_PROJECT)
 GOOGLE_CLOUD_LOCATION = env("GOOGLE_CLOUD_LOCATION", DEFAULT_LOCATION)
-REFRESH_VECTORS_ON_STARTUP = env("REFRESH_VECTORS_ON_STARTUP", "true").lower() == "true"
 
 # ======================
 # OpenAI setup
 # ======================
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI, OpenAI
 except Exception:
+    AsyncOpenAI = None
     OpenAI = None
 
 try:
-    from vector import load_vector_store
+    from embed_cache import EMBED_DIM, EMBED_MODEL, cache_stats, get_cache
+except Exception as e:
+    EMBED_DIM, EMBED_MODEL = 1536, "text-embedding-3-small"
+    cache_stats = None
+    get_cache = None
+
+try:
+    from embeddings import dimension_args, embed_batched
+except Exception as e:
+    embed_batched = None
+    dimension_args = lambda model, dim: {}
+
+try:
+    from vector import load_vector_store, list_sources, index_key, index_version, lexical_search, search as search_documents
 except Exception as e:
     load_vector_store = None
+    list_sources = None
+    index_key = None
+    index_version = None
+    lexical_search = None
+    search_documents = None
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if OpenAI is None:
@@ -93,101 +130,218 @@ if OpenAI is None:
     _openai_client = None
 else:
     try:
-        _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        # Retries, timeouts and concurrency are handled by governor.py, not by the SDK.
+        _openai_client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+        _async_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
     except Exception as e:
         _openai_client = None
         log.error(f"Failed to initialize OpenAI client: {e}")
+if _openai_client is None:
+    _async_openai_client = None
+
+# ======================
+# Async execution
+# ======================
+# Upstream OpenAI calls are awaited on the event loop through the per-model governor (concurrency,
+# timeouts, retries, circuit breaker), within ASK_DEADLINE_S of the request arriving.
+# Blocking CPU work (FAISS, waiting on sympy workers) goes to a small pool.
+ASK_DEADLINE_S = float(os.getenv("ASK_DEADLINE_S", "30"))
+EMBED_TIMEOUT_S = float(os.getenv("OPENAI_EMBED_TIMEOUT_S", "5"))
+EMOTION_TIMEOUT_S = float(os.getenv("OPENAI_EMOTION_TIMEOUT_S", "5"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "4"))
+_cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+
+async def run_cpu(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_pool, functools.partial(fn, *args, **kwargs))
 
 # ======================
 # Embeddings / LLMs
 # ======================
 class OpenAIEmbedder:
-    def __init__(self, client: "OpenAI", model: str = "text-embedding-3-small", dim: int = 512):
+    def __init__(self, client: "OpenAI", model: str = "text-embedding-3-small", dim: int = 1536, cache=None,
+                 async_client: "AsyncOpenAI | None" = None):
         self.client = client
+        self.async_client = async_client
         self.model = model
         self.dim = dim
-
-    def embed_query(self, text: str):
+        self.cache = cache
+        self.governor = governor(model)
+
+    def _fallback_vector(self, text: str):
+        h = hashlib.sha256(text.encode("utf-8")).digest()
+        vec = []
+        prev = h
+        while len(vec) < self.dim:
+            prev = hashlib.sha256(prev).digest()
+            vec.extend([b / 255.0 for b in prev])
+        return vec[:self.dim]
+
+    def embed_query(self, text: str, fallback: bool = True):
         if not text:
             return [0.0] * self.dim
         if self.client is None:
-            h = hashlib.sha256(text.encode("utf-8")).digest()
-            vec = []
-            prev = h
-            while len(vec) < self.dim:
-                prev = hashlib.sha256(prev).digest()
-                vec.extend([b / 255.0 for b in prev])
-            return vec[:self.dim]
+            if not fallback:
+                raise RuntimeError("OpenAI client not initialized")
+            return self._fallback_vector(text)
+        if self.cache is not None:
+            cached = self.cache.get(text)
+            if cached is not None:
+                return cached.tolist()
         try:
-            res = self.client.embeddings.create(model=self.model, input=text)
-            return res.data[0].embedding
+            res = self.governor.call_sync(
+                lambda timeout: self.client.embeddings.create(model=self.model, input=text, timeout=timeout,
+                                                              **dimension_args(self.model, self.dim)),
+                EMBED_TIMEOUT_S)
+            embedding = res.data[0].embedding
+            if self.cache is not None:
+                self.cache.put(text, embedding)
+            return embedding
         except Exception as e:
+            if not fallback:
+                raise
             log.warning(f"Embedding call failed: {e}; using fallback embedder.")
-            h = hashlib.sha256(text.encode("utf-8")).digest()
-            vec = []
-            prev = h
-            while len(vec) < self.dim:
-                prev = hashlib.sha256(prev).digest()
-                vec.extend([b / 255.0 for b in prev])
-            return vec[:self.dim]
+            return self._fallback_vector(text)
+
+    async def aembed_query(self, text: str, fallback: bool = True):
+        if not text or self.async_client is None:
+            return await run_in_threadpool(self.embed_query, text, fallback)
+        if self.cache is not None:
+            cached = self.cache.get(text)
+            if cached is not None:
+                return cached.tolist()
+        try:
+            res = await self.governor.call(
+                lambda timeout: self.async_client.embeddings.create(model=self.model, input=text, timeout=timeout,
+                                                                    **dimension_args(self.model, self.dim)),
+                EMBED_TIMEOUT_S)
+            embedding = res.data[0].embedding
+            if self.cache is not None:
+                self.cache.put(text, embedding)
+            return embedding
+        except Exception as e:
+            if not fallback:
+                raise
+            log.warning(f"Embedding call failed: {e}; using fallback embedder.")
+            return self._fallback_vector(text)
+
+    def embed_documents(self, texts: list[str]):
+        """Embed many texts: cache first, then token-packed batches sent concurrently."""
+        if self.client is None or embed_batched is None:
+            return [self.embed_query(t) for t in texts]
+        vectors = self.cache.get_many(texts) if self.cache is not None else [None] * len(texts)
+        missing = [i for i, v in enumerate(vectors) if v is None and texts[i]]
+        if missing:
+            try:
+                fresh = embed_batched(self.client, self.model, [texts[i] for i in missing], self.dim)
+                if self.cache is not None:
+                    self.cache.put_many([texts[i] for i in missing], fresh)
+            except Exception as e:
+                log.warning(f"Batch embedding failed: {e}; using fallback embedder.")
+                fresh = [self._fallback_vector(texts[i]) for i in missing]
+            for i, vec in zip(missing, fresh):
+                vectors[i] = vec
+        return [
+            [0.0] * self.dim if v is None else (v.tolist() if hasattr(v, "tolist") else v)
+            for v in vectors
+        ]
+
+def _completion_text(resp) -> str:
+    content = ""
+    if resp and getattr(resp, "choices", None):
+        choice = resp.choices[0]
+        message = getattr(choice, "message", None)
+        if message and getattr(message, "content", None):
+            content = message.content
+        else:
+            content = getattr(choice, "text", "") or getattr(resp, "output_text", "") or ""
+    return content.strip()
 
 class OpenAIChatLLM:
-    def __init__(self, client: "OpenAI", model: str = "gpt-4o-mini", system_prompt: str | None = None):
+    def __init__(self, client: "OpenAI", model: str = "gpt-4o-mini", system_prompt: str | None = None,
+                 async_client: "AsyncOpenAI | None" = None):
         self.client = client
+        self.async_client = async_client
         self.model = model
         self.system_prompt = system_prompt or (
             "You are Brightly, the official AI assistant of ABC Senior Secondary School, Chennai. "
             "Answer in a concise, helpful, teacher-style manner."
         )
 
+    def _messages(self, prompt: str):
+        return [{"role": "system", "content": self.system_prompt},{"role": "user", "content": prompt}]
+
     def invoke(self, prompt: str, temperature: float = 0.2, max_tokens: int = 1024):
         if self.client is None:
             raise RuntimeError("OpenAI client not initialized")
-        try:
-            resp = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "system", "content": self.system_prompt},{"role": "user", "content": prompt}],
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            content = ""
-            if resp and getattr(resp, "choices", None):
-                choice = resp.choices[0]
-                message = getattr(choice, "message", None)
-                if message and getattr(message, "content", None):
-                    content = message.content
-                else:
-                    content = getattr(choice, "text", "") or getattr(resp, "output_text", "") or ""
-            return content.strip()
-        except Exception as e:
-            raise
+        resp = governor(self.model).call_sync(lambda timeout: self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout,
+        ))
+        return _completion_text(resp)
+
+    async def ainvoke(self, prompt: str, temperature: float = 0.2, max_tokens: int = 1024):
+        if self.async_client is None:
+            return await run_in_threadpool(self.invoke, prompt, temperature, max_tokens)
+        resp = await governor(self.model).call(lambda timeout: self.async_client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout,
+        ))
+        return _completion_text(resp)
+
+    async def astream(self, prompt: str, temperature: float = 0.2, max_tokens: int = 1024):
+        """Yield the completion as it is generated (one chunk when no async client)."""
+        if self.async_client is None:
+            yield await self.ainvoke(prompt, temperature, max_tokens)
+            return
+        stream = governor(self.model).stream(lambda timeout: self.async_client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            timeout=timeout,
+        ))
+        async for chunk in stream:
+            delta = chunk.choices[0].delta if chunk.choices else None
+            if delta is not None and getattr(delta, "content", None):
+                yield delta.content
 
 class OpenAIEmotionLLM:
-    def __init__(self, client: "OpenAI", model: str = "gpt-4o-mini"):
+    def __init__(self, client: "OpenAI", model: str = "gpt-4o-mini", async_client: "AsyncOpenAI | None" = None):
         self.client = client
+        self.async_client = async_client
         self.model = model
 
     def invoke(self, prompt: str):
         if self.client is None:
             raise RuntimeError("OpenAI client not initialized")
-        try:
-            resp = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.0,
-                max_tokens=32,
-            )
-            content = ""
-            if resp and getattr(resp, "choices", None):
-                choice = resp.choices[0]
-                message = getattr(choice, "message", None)
-                if message and getattr(message, "content", None):
-                    content = message.content
-                else:
-                    content = getattr(choice, "text", "") or getattr(resp, "output_text", "") or ""
-            return content.strip()
-        except Exception as e:
-            raise
+        resp = governor(self.model).call_sync(lambda timeout: self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0,
+            max_tokens=32,
+            timeout=timeout,
+        ), EMOTION_TIMEOUT_S)
+        return _completion_text(resp)
+
+    async def ainvoke(self, prompt: str):
+        if self.async_client is None:
+            return await run_in_threadpool(self.invoke, prompt)
+        resp = await governor(self.model).call(lambda timeout: self.async_client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0,
+            max_tokens=32,
+            timeout=timeout,
+        ), EMOTION_TIMEOUT_S)
+        return _completion_text(resp)
 
 _embedding_model = None
 _answer_llm = None
@@ -196,19 +350,28 @@ _emotion_llm = None
 def get_embedding_model():
     global _embedding_model
     if _embedding_model is None:
-        _embedding_model = OpenAIEmbedder(client=_openai_client, model=os.getenv("OPENAI_EMBEDDING_MODEL","text-embedding-3-small"), dim=512)
+        cache = None
+        if get_cache is not None:
+            try:
+                cache = get_cache(EMBED_MODEL, EMBED_DIM)
+            except Exception as e:
+                log.warning(f"⚠️ Embedding cache unavailable: {e}")
+        _embedding_model = OpenAIEmbedder(client=_openai_client, model=EMBED_MODEL, dim=EMBED_DIM, cache=cache,
+                                          async_client=_async_openai_client)
     return _embedding_model
 
 def get_answer_llm():
     global _answer_llm
     if _answer_llm is None:
-        _answer_llm = OpenAIChatLLM(client=_openai_client, model=os.getenv("OPENAI_CHAT_MODEL","gpt-4o-mini"))
+        _answer_llm = OpenAIChatLLM(client=_openai_client, model=os.getenv("OPENAI_CHAT_MODEL","gpt-4o-mini"),
+                                    system_prompt=SYSTEM_PREFIX, async_client=_async_openai_client)
     return _answer_llm
 
 def get_emotion_llm():
     global _emotion_llm
     if _emotion_llm is None:
-        _emotion_llm = OpenAIEmotionLLM(client=_openai_client, model=os.getenv("OPENAI_CHAT_MODEL","gpt-4o-mini"))
+        _emotion_llm = OpenAIEmotionLLM(client=_openai_client, model=os.getenv("OPENAI_CHAT_MODEL","gpt-4o-mini"),
+                                        async_client=_async_openai_client)
     return _emotion_llm
 
 # ======================
@@ -254,12 +417,16 @@ def tree_to_list(tree, prefix=""):
             })
     return result
 
+def _internal_blob(name: str) -> bool:
+    """Bucket objects the app keeps for itself (_faq.json, _dashboard_password.txt, snapshots/); not documents."""
+    return name.lstrip("/").startswith(("_", f"{SNAPSHOT_PREFIX}/"))
+
 @app.get("/files")
 def list_files():
     # Try GCS first, then fallback to local data/ folder
     try:
         bucket = storage_client.bucket(BUCKET_NAME)
-        files = [b.name for b in bucket.list_blobs()]
+        files = [b.name for b in bucket.list_blobs() if not _internal_blob(b.name)]
     except Exception as e:
         log.warning(f"⚠️ GCS list failed: {e}; falling back to local data/")
         files = []
@@ -287,6 +454,8 @@ from fastapi import HTTPException
 def read_file(filename: str):
     # Proper decoding (safe even if already decoded)
     filename = unquote(filename)
+    if _internal_blob(filename):
+        raise HTTPException(status_code=404, detail="File not found")
 
     bucket = storage_client.bucket(BUCKET_NAME)
     blob = bucket.blob(filename)
@@ -316,12 +485,14 @@ async def create_file(request: Request):
 
     # Always add .txt once
     filename += ".txt"
+    if _internal_blob(filename):
+        return JSONResponse({"error": "Reserved file name"}, status_code=400)
 
     
     # Try upload to GCS
     try:
         bucket = storage_client.bucket(BUCKET_NAME)
-        bucket.blob(filename).upload_from_string(content)
+        await run_in_threadpool(bucket.blob(filename).upload_from_string, content)
         return JSONResponse({"status": "created", "file": filename})
     except Exception as e:
         log.warning(f"⚠️ GCS create failed for {filename}: {e}; writing locally")
@@ -354,16 +525,18 @@ async def update_file(request: Request):
 
     filename = filename.replace(" ", "_").lower() + ".txt"
     filename = filename.replace('%2F', '/').replace('%5C', '/')
+    if _internal_blob(filename):
+        return JSONResponse({"error": "Reserved file name"}, status_code=400)
     
     try:
         bucket = storage_client.bucket(BUCKET_NAME)
         blob = bucket.blob(filename)
-        blob.upload_from_string(content, content_type="text/plain")
+        await run_in_threadpool(blob.upload_from_string, content, content_type="text/plain")
         log.info(f"✅ Successfully updated file in GCS: {filename}")
         
         # Refresh vector stores after file update
         try:
-            refresh_vector_stores()
+            await run_in_threadpool(refresh_vector_stores)
             log.info("✅ Vector stores refreshed after file update")
         except Exception as e:
             log.warning(f"⚠️ Vector refresh failed: {e}")
@@ -385,7 +558,7 @@ async def update_file(request: Request):
         
         # Refresh vectors even for local updates
         try:
-            refresh_vector_stores()
+            await run_in_threadpool(refresh_vector_stores)
         except Exception as e:
             log.warning(f"⚠️ Vector refresh failed: {e}")
         
@@ -402,6 +575,8 @@ def delete_file(filename: str):
 
     filename = filename.replace(" ", "_").lower() + ".txt"
     filename = filename.replace('%2F', '/').replace('%5C', '/')
+    if _internal_blob(filename):
+        return JSONResponse({"error": "File not found"}, status_code=404)
 
     
     # Try delete from GCS, fallback to local delete
@@ -435,9 +610,25 @@ def delete_file(filename: str):
 # ======================
 # Globals / Memory
 # ======================
-conversation_history = []
-session_memory = []
+session_store = SessionStore()  # per-browser turns + memory, evicted after SESSION_TTL_S idle
 vector_stores = {}
+faq_engine = FAQEngine()
+math_engine = MathEngine()
+emotion_classifier = EmotionClassifier()
+fee_engine = FeeEngine()
+answer_cache = ResponseCache()
+in_flight = SingleFlight()  # identical concurrent sub-questions share one retrieval + LLM call
+
+# Background warm-up state (see warm_up / GET /ready); times are seconds since process start.
+WARMUP = {"stage": "pending", "ready": False, "error": None,
+          "started_s": None, "ready_s": None, "first_request_s": None}
+index_ready = asyncio.Event()
+WARMUP_WAIT_S = float(os.getenv("WARMUP_WAIT_S", "10"))
+WARMUP_RETRY_S = float(os.getenv("WARMUP_RETRY_S", "30"))  # first retry after a failed warm-up; doubles up to 5 min
+WARMUP_RETRY_MAX_S = 300.0
+
+def _since_start():
+    return round(time.monotonic() - _PROCESS_START, 3)
 
 os.makedirs("vectorstore", exist_ok=True)
 os.makedirs("sessions", exist_ok=True)
@@ -456,6 +647,9 @@ if os.path.isdir("dist"):
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
+    if WARMUP["first_request_s"] is None and request.url.path not in ("/health", "/ready"):
+        WARMUP["first_request_s"] = _since_start()
+        log.info(f"⏱️ First request after {WARMUP['first_request_s']}s: {request.url.path}")
     if DEBUG:
         log.debug(f"➡️  {request.method} {request.url.path}")
     response = await call_next(request)
@@ -471,11 +665,13 @@ def index():
         "message": "ABC Senior Secondary School — API online",
         "project": GOOGLE_CLOUD_PROJECT,
         "location": GOOGLE_CLOUD_LOCATION,
-        "vectors_refreshed_on_startup": REFRESH_VECTORS_ON_STARTUP
+        "index_ready": WARMUP["ready"]
     })
 
 @app.get("/files/{filename}")
 def get_file(filename: str):
+    if _internal_blob(filename):
+        raise HTTPException(status_code=404, detail="Not Found")
     client = storage.Client()
     bucket = client.bucket(BUCKET_NAME)
     blob = bucket.blob(filename)
@@ -489,6 +685,13 @@ def get_file(filename: str):
 def health():
     return {"status": "ok", "allowed": allowed_origins}
 
+@app.get("/ready")
+def ready():
+    """200 once warm-up has finished (even with nothing indexed); 503 with its progress (or the last failure) until then."""
+    body = {**WARMUP, "files": len(vector_stores), "uptime_s": _since_start(),
+            "index_version": index_version() if index_version else None}
+    return JSONResponse(body, status_code=200 if WARMUP["ready"] else 503)
+
 
 @app.get("/llm/health")
 def llm_health():
@@ -530,7 +733,7 @@ async def change_password(request: Request):
     try:
         bucket = storage_client.bucket(BUCKET_NAME)
         blob = bucket.blob("_dashboard_password.txt")
-        blob.upload_from_string(new_password, content_type="text/plain")
+        await run_in_threadpool(blob.upload_from_string, new_password, content_type="text/plain")
         log.info("Password saved to GCS")
     except Exception as e:
         log.warning(f"Failed to save password to GCS: {e}")
@@ -543,184 +746,165 @@ async def change_password(request: Request):
     log.info("Password changed successfully")
     return JSONResponse({"success": True, "message": "Password changed successfully. Please update GCP env var: --set-env-vars DASHBOARD_PASSWORD=\"" + new_password + "\""})
 
-# ======================
-# Math Utilities
-# ======================
-def solve_math_expression(expr: str):
-    try:
-        import sympy as sp
-        expr = expr.lower().replace("^", "**").replace("×", "*").replace("÷", "/").strip()
-        x, y, z = sp.symbols("x y z")
-        allowed = {"sin": lambda deg: math.sin(math.radians(float(deg))),
-                   "cos": lambda deg: math.cos(math.radians(float(deg))),
-                   "tan": lambda deg: math.tan(math.radians(float(deg))),
-                   "asin": lambda val: math.degrees(math.asin(float(val))),
-                   "acos": lambda val: math.degrees(math.acos(float(val))),
-                   "atan": lambda val: math.degrees(math.atan(float(val))),
-                   "sqrt": math.sqrt,
-                   "log": math.log10,
-                   "ln": math.log,
-                   "pi": math.pi,
-                   "e": math.e,
-                   "pow": pow,
-                   }
-        if "=" in expr:
-            lhs, rhs = expr.split("=")
-            solution = sp.solve(sp.sympify(lhs) - sp.sympify(rhs), x)
-            if not solution:
-                return "No real solution found."
-            if len(solution) == 1:
-                return f"The value of x is {solution[0]}."
-            return f"Possible values of x are: {', '.join(map(str, solution))}."
-        try:
-            simplified = sp.simplify(expr)
-            if str(simplified) != expr:
-                expr = str(simplified)
-        except Exception:
-            pass
-        result = eval(expr, {"__builtins__": None}, allowed)
-        if isinstance(result, float):
-            result = round(result, 6)
-        return f"The result is {result}"
-    except Exception as e:
-        log.warning(f"⚠️ Math solver error: {e}")
-        return None
-
-def explain_math_step_by_step(expr: str):
-    import sympy as sp
-    x, y, z = sp.symbols("x y z")
-    try:
-        expr = expr.lower().replace("^", "**").replace("×", "*")
-        if ("differentiate" in expr) or ("derivative" in expr) or ("find dy/dx" in expr):
-            target = expr.split("of")[-1].strip()
-            func = sp.sympify(target)
-            result = sp.diff(func, x)
-            return f"The derivative of {func} with respect to x is: {result}"
-        elif ("integrate" in expr) or ("integration" in expr):
-            target = expr.split("of")[-1].strip()
-            func = sp.sympify(target)
-            result = sp.integrate(func, x)
-            return f"The integral of {func} with respect to x is: {result} + C"
-        elif "=" in expr:
-            lhs, rhs = expr.split("=")
-            solution = sp.solve(sp.sympify(lhs) - sp.sympify(rhs), x)
-            steps = [f"Step 1️⃣: Start with {lhs} = {rhs}",
-                     f"Step 2️⃣: Move all terms to one side: ({lhs}) - ({rhs}) = 0",
-                     f"Step 3️⃣: Simplify and solve for x",
-                     f"✅ Solution: x = {solution}"]
-            return "\n".join(steps)
-        else:
-            simplified = sp.simplify(expr)
-            return f"Simplified form: {simplified}"
-    except Exception:
-        return None
-
 # ======================
 # Memory helpers
 # ======================
-def add_to_memory(question: str, answer: str):
-    try:
-        embed = get_embedding_model().embed_query(question)
-    except Exception as e:
-        log.warning(f"⚠️ Embedding error: {e}")
-        embed = None
-    session_memory.append({"question": question, "answer": answer, "embedding": embed})
+class QueryContext:
+    """Per-question state for one /ask call; the question is embedded at most once."""
+    def __init__(self, text: str, session: Session):
+        self.text = text
+        self.session = session
+        self.cache_key = None  # set by prepare_subquestion when the LLM answer may be cached
+        self.results = []      # retrieved chunks, kept for the no-LLM fallback
+        self._embedding = None
+        self._embedded = False
+
+    @property
+    def embedding(self):
+        # Real embedding or None — hash fallbacks would poison the FAISS search.
+        if not self._embedded:
+            self._embedded = True
+            try:
+                self._embedding = get_embedding_model().embed_query(self.text, fallback=False)
+            except Exception as e:
+                log.warning(f"⚠️ Embedding error: {e}")
+        return self._embedding
 
-def retrieve_relevant_memory(question: str, top_n=5):
-    try:
-        query_embed = get_embedding_model().embed_query(question)
-    except Exception as e:
-        log.warning(f"⚠️ Embedding error: {e}")
-        return ""
-    if not session_memory:
-        return ""
-    def cosine_similarity(a, b):
-        if a is None or b is None:
-            return 0
-        dot = sum(x*y for x,y in zip(a,b))
-        norm_a = sum(x*x for x in a)**0.5
-        norm_b = sum(y*y for y in b)**0.5
-        if norm_a==0 or norm_b==0:
-            return 0
-        return dot/(norm_a*norm_b)
-    scored=[]
-    for entry in session_memory:
-        score = cosine_similarity(query_embed, entry["embedding"])
-        scored.append((score, entry))
-    scored.sort(reverse=True,key=lambda x:x[0])
-    top_entries = [f"Q: {e['question']}\nA: {e['answer']}" for _, e in scored[:top_n]]
-    return "\n".join(top_entries)
+    async def aembed(self):
+        """Async twin of `embedding`; after this, reading `.embedding` never blocks."""
+        if not self._embedded:
+            self._embedded = True
+            try:
+                self._embedding = await get_embedding_model().aembed_query(self.text, fallback=False)
+            except Exception as e:
+                log.warning(f"⚠️ Embedding error: {e}")
+        return self._embedding
+
+def add_to_memory(session: Session, question: str, answer: str, ctx: QueryContext | None = None):
+    embed = (ctx or QueryContext(question, session)).embedding
+    session.memory.add(question, answer, embed)
+
+async def remember(session: Session, question: str, answer: str, ctx: QueryContext | None = None):
+    ctx = ctx or QueryContext(question, session)
+    await ctx.aembed()
+    add_to_memory(session, question, answer, ctx)
+
+def retrieve_relevant_memory(question: str, session: Session, top_n=5, ctx: QueryContext | None = None, embed=True):
+    """
+    Most similar past (question, answer) turns of this session; with embed=False
+    and no embedding yet, its latest turns instead.
+    """
+    if not len(session.memory):
+        return []
+    ctx = ctx or QueryContext(question, session)
+    if not embed and not ctx._embedded:
+        return session.memory.recent(top_n)[::-1]
+    query_embed = ctx.embedding
+    if query_embed is None:
+        return []
+    return [(q, a) for _, q, a in session.memory.top_k(query_embed, top_n)]
 
 # ======================
 # Greetings / Farewell / Emotion
 # ======================
-GREETINGS = ["hello", "hi", "hey", "good morning", "good afternoon", "good evening"]
-FAREWELLS = ["bye", "goodbye", "see you", "farewell"]
-
-def check_greeting(q: str):
-    q=q.lower()
-    if any(g in q for g in GREETINGS):
+# Small-talk replies only when the message asks nothing else ("hi, fees for 5th?" is a question).
+def check_greeting(route: Route):
+    if "greeting" in route.intents and route.small_talk:
         return "Welcome to ABC School! I'm Brightly, your assistant. How can I help you today?"
     return None
 
-def check_farewell(q: str):
-    q=q.lower()
-    if any(f in q for f in FAREWELLS):
+def check_farewell(route: Route):
+    if "farewell" in route.intents and route.small_talk:
         return "Goodbye! Have a great day 🌟 Come back soon!"
     return None
 
-def detect_emotion(user_input: str):
-    factual_keywords = ["what","where","when","how","who","which","fee","fees","address","location",
-                        "principal","teacher","school","exam","contact","number","subject","student","class","admission"]
-    if any(re.search(rf"\b{kw}\b", user_input.lower()) for kw in factual_keywords):
+async def detect_emotion(user_input: str, route: Route | None = None):
+    if "factual" in (route or route_query(user_input)).intents:
         return None
     if any(emoji in user_input for emoji in ["💡", "😊", "😄", "🎉", "🥳"]):
         return None
-    prompt=f"""
-Detect if this message is Positive (appreciation/humor) or Negative (complaint/anger).
-Return only: Positive / Negative / Neutral
-Message: {user_input}
-"""
-    try:
-        resp = get_emotion_llm().invoke(prompt).strip().capitalize()
-        if resp=="Positive":
-            responses = ["That's really kind of you, thank you 😊","Glad to hear that! You're awesome!","That made my day 😄","You're too sweet — thanks a lot!","Aww, I appreciate that 💫"]
-            return random.choice(responses)
-        elif resp=="Negative":
-            return "I'm sorry if something felt off. Let’s fix it together."
-    except Exception as e:
-        log.warning(f"⚠️ Emotion detection error: {e}")
+    resp=await emotion_classifier.classify(user_input, get_emotion_llm().ainvoke)
+    if resp=="Positive":
+        responses = ["That's really kind of you, thank you 😊","Glad to hear that! You're awesome!","That made my day 😄","You're too sweet — thanks a lot!","Aww, I appreciate that 💫"]
+        return random.choice(responses)
+    elif resp=="Negative":
+        return "I'm sorry if something felt off. Let’s fix it together."
     return None
 
 # ======================
 # Vector store & NCERT
 # ======================
-INTENT_MAP = {
-    "fees": ["fee", "fees", "structure", "tuition"],
-    "staff": ["principal", "teacher", "staff"],
-    "address": ["address", "location", "contact"],
-    "self_identity": ["who are you", "your name", "what are you", "who created you"],
-}
-
-def refresh_vector_stores():
+def refresh_vector_stores(progress=None):
+    """
+    Sync the bucket (data files and the admin FAQ) and (re)load the shared index once;
+    one namespace per data/*.txt file.
+    Raises if the sync or load fails; the previously loaded index (if any) keeps serving.
+    """
     global vector_stores
-    vector_stores={}
+    try:
+        if pull_faq():
+            refresh_faq(reload=True)
+    except Exception as e:
+        log.warning(f"⚠️ FAQ sync from bucket failed: {e}")
     if load_vector_store is None:
         log.info("ℹ️ load_vector_store unavailable; skipping vector build.")
+        vector_stores={}
         return
     if not os.path.isdir("data"):
         log.info("ℹ️ No data directory found; skipping vector build.")
+        vector_stores={}
         return
-    current_files = {os.path.splitext(f)[0]: os.path.join("data", f) for f in os.listdir("data") if f.endswith(".txt")}
-    for name,file in current_files.items():
+    try:
+        load_vector_store(progress=progress)
+    except Exception as e:
+        log.warning(f"⚠️ Failed to build vector index: {e}")
+        raise
+    finally:
         try:
-            retriever = load_vector_store()
-            if retriever:
-                vector_stores[name]=retriever
+            fee_engine.refresh("data")  # re-parses only fee files that changed in the sync
         except Exception as e:
-            log.warning(f"⚠️ Failed to build retriever for '{file}': {e}")
+            log.warning(f"⚠️ Fee table refresh failed: {e}")
+    vector_stores={os.path.splitext(f)[0]: count for f,count in list_sources().items()}
+    answer_cache.set_index(index_key())  # answers from an older index are dropped
     log.info(f"✅ Vector stores loaded: {list(vector_stores.keys())}")
 
+FAQ_BLOB="_faq.json"  # admin FAQ edits live in the bucket, like the dashboard password
+_faq_generation=None
+
+def pull_faq() -> bool:
+    """Download the bucket's FAQ over the local file when it changed; True if it did."""
+    global _faq_generation
+    blob=storage_client.bucket(BUCKET_NAME).get_blob(FAQ_BLOB)
+    if blob is None or blob.generation==_faq_generation:
+        return False
+    tmp=faq_engine.path+".tmp"
+    blob.download_to_filename(tmp)
+    os.replace(tmp,faq_engine.path)
+    _faq_generation=blob.generation
+    log.info(f"📚 FAQ pulled from bucket (generation {blob.generation})")
+    return True
+
+def push_faq() -> bool:
+    """Save the FAQ locally and upload it, so other replicas and restarts see the edit."""
+    global _faq_generation
+    faq_engine.save()
+    try:
+        blob=storage_client.bucket(BUCKET_NAME).blob(FAQ_BLOB)
+        blob.upload_from_filename(faq_engine.path,content_type="application/json")
+        _faq_generation=blob.generation
+        return True
+    except Exception as e:
+        log.warning(f"⚠️ Failed to save FAQ to GCS: {e}")
+        return False
+
+def refresh_faq(reload: bool = False):
+    if reload:
+        faq_engine.load()
+    try:
+        faq_engine.build_vectors(get_embedding_model().embed_documents)
+    except Exception as e:
+        log.warning(f"⚠️ FAQ vectors unavailable (exact matches only): {e}")
+
 # ======================
 # Helper utilities
 # ======================
@@ -729,158 +913,341 @@ def split_subquestions(q: str):
         return [q.strip()]
     return [s.strip() for s in re.split(r"[?;]| and ", q) if s.strip()]
 
-CLASS_MAP = {
-    "lkg": "LKG", "ukg": "UKG", "1st": "I", "first": "I", "i": "I",
-    "2nd": "II", "second": "II", "3rd": "III", "third": "III",
-    "4th": "IV", "5th": "V", "6th": "VI", "7th": "VII", "8th": "VIII",
-    "9th": "IX", "10th": "X", "tenth": "X",
-    "11th cs": "XI-CS", "11th bio": "XI-BIO", "11th comm": "XI-COMM",
-    "12th cs": "XII-CS", "12th bio": "XII-BIO", "12th comm": "XII-COMM",
-}
-
-def safe_retrieve(retriever, query):
-    if hasattr(retriever, "get_relevant_documents"):
-        return retriever.get_relevant_documents(query)
-    return retriever._get_relevant_documents(query, run_manager=None)
+def safe_retrieve(query, k=3, files=None, ctx: QueryContext | None = None):
+    if search_documents is None or not vector_stores:
+        return []
+    if ctx is None:
+        return search_documents(query, k=k, sources=files)
+    if ctx.embedding is None:
+        # Embeddings unavailable: keyword hits are still better than no context.
+        return safe_lexical_retrieve(query, k, files)[0]
+    return search_documents(query, k=k, sources=files, embedding=ctx.embedding)
+
+def safe_lexical_retrieve(query, k=3, files=None):
+    """BM25-only hits and whether they are confident enough to skip the embedding."""
+    if lexical_search is None or not vector_stores:
+        return [], False
+    try:
+        return lexical_search(query, k=k, sources=files)
+    except Exception as e:
+        log.warning(f"⚠️ Lexical retriever error: {e}")
+        return [], False
 
 # ======================
 # Admin endpoints
 # ======================
 class Query(BaseModel):
     question: str
+    session_id: str | None = None
 
 @app.post("/admin/refresh")
 def admin_refresh():
     try:
         refresh_vector_stores()
-        return {"ok": True,"message":"Vectors refreshed","stores": list(vector_stores.keys())}
+        return {"ok": True,"message":"Vectors refreshed","stores": list(vector_stores.keys()),
+                "index_version": index_version() if index_version else None}
     except Exception as e:
         return JSONResponse(status_code=500, content={"ok": False,"error": str(e)})
 
+@app.get("/admin/cache/stats")
+def admin_cache_stats():
+    return {"embeddings": cache_stats() if cache_stats else [], "faq": faq_engine.stats(),
+            "math": math_engine.stats(), "emotion": emotion_classifier.stats(), "fees": fee_engine.stats(),
+            "answers": answer_cache.stats(), "in_flight": in_flight.stats(), "upstream": governor_stats(),
+            "sessions": session_store.stats()}
+
+class FAQEntry(BaseModel):
+    password: str
+    question: str
+    answer: str = ""
+    verified: bool = True
+
+@app.get("/admin/faq")
+def admin_faq_list(password: str = ""):
+    check_password(password)
+    return {"entries": faq_engine.entries()}
+
+@app.post("/admin/faq")
+def admin_faq_upsert(entry: FAQEntry):
+    check_password(entry.password)
+    if not entry.question.strip() or not entry.answer.strip():
+        return JSONResponse({"error": "Question and answer required"}, status_code=400)
+    faq_engine.upsert(entry.question.strip(), entry.answer.strip(), entry.verified)
+    persisted = push_faq()
+    refresh_faq()
+    return {"ok": True, "persisted": persisted, "faq": faq_engine.stats()}
+
+@app.post("/admin/faq/invalidate")
+def admin_faq_invalidate(entry: FAQEntry):
+    check_password(entry.password)
+    if not faq_engine.invalidate(entry.question):
+        return JSONResponse({"error": "FAQ entry not found"}, status_code=404)
+    persisted = push_faq()
+    refresh_faq()
+    return {"ok": True, "persisted": persisted, "faq": faq_engine.stats()}
+
+# ======================
+# Sub-question answering
+# ======================
+SIMPLE_MATH_QUESTIONS = {"quadratic equations":"A quadratic equation is of the form ax² + bx + c = 0. The solutions are x = [-b ± √(b² - 4ac)] / 2a."}
+SUBQUESTION_CONCURRENCY = int(os.getenv("SUBQUESTION_CONCURRENCY", "4"))
+
+LLM_ERROR_ANSWER = "I’m having trouble accessing the data at the moment, please try again."
+
+def fallback_answer(ctx: QueryContext, error: Exception) -> str:
+    """Local answer when the LLM is down, overloaded or out of time: the best retrieved passage."""
+    log.warning(f"⚠️ LLM unavailable ({error}); answering locally")
+    if ctx.results:
+        passage=ctx.results[0].page_content.strip()
+        if len(passage)>600:
+            passage=passage[:600].rsplit(" ",1)[0]+" …"
+        return "⚠️ I can’t reach my answer service right now — here is what the school records say:\n\n"+passage
+    return LLM_ERROR_ANSWER
+
+async def prepare_subquestion(sq: str, ctx: QueryContext):
+    """
+    Resolve one part of a compound question up to the LLM call.
+    Returns (answer, None) when a local path answers it, else (None, prompt).
+    """
+    for key,val in SIMPLE_MATH_QUESTIONS.items():
+        if key in sq.lower():
+            return val, None
+    route=route_query(sq)
+    if "fees" in route.intents and (answer:=fee_engine.answer(sq, route.classes)):
+        return answer, None
+    if expr:=math_expression(sq):
+        answer=await run_cpu(math_engine.solve,expr)
+        if answer:
+            return answer, None
+    if answer:=faq_engine.lookup_exact(sq):
+        return answer, None
+    # Keyword-exact questions ("XI-CS teacher", "bus route 7") with a confident BM25 hit skip the embeddings call.
+    results,confident=safe_lexical_retrieve(sq,CONTEXT_CANDIDATES) if index_ready.is_set() else ([],False)
+    if not confident:
+        if answer:=faq_engine.lookup_semantic(await ctx.aembed()):
+            return answer, None
+        if not index_ready.is_set():
+            # Cold start: give the warm-up a moment rather than answering from no context.
+            try:
+                await asyncio.wait_for(index_ready.wait(), WARMUP_WAIT_S)
+            except asyncio.TimeoutError:
+                log.info("⏳ Index still warming; answering without retrieved context")
+        try:
+            results=await run_cpu(safe_retrieve,sq,CONTEXT_CANDIDATES,ctx=ctx)
+        except Exception as e:
+            log.warning(f"⚠️ Retriever error: {e}")
+            results=[]
+    ctx.results=results
+    turns=retrieve_relevant_memory(sq,ctx.session,ctx=ctx,embed=not confident)
+    # A prompt carrying this session's turns yields an answer only this session may reuse.
+    ctx.cache_key=make_key(sq,ctx._embedding,results,index_key() if index_key else None,
+                           ctx.session.id if turns else None)
+    if answer:=answer_cache.lookup(ctx.cache_key):
+        return answer, None
+    return None, user_prompt(build_context(results,turns), sq)
+
+def flight_key(sq: str, ctx: QueryContext):
+    """
+    Sub-questions coalesce across sessions only while the asking session has no
+    turns: once it has, its prompt may carry them (memory is filled in the
+    background, so the turn log is the earlier signal), and it flies alone.
+    """
+    private=ctx.session.total or is_conversational(sq)
+    return normalize_question(sq), ctx.session.id if private else None
+
+async def answer_subquestion(sq: str, ctx: QueryContext) -> str:
+    """Answer one part of a compound question; safe to run concurrently with its siblings."""
+    async def compute():
+        answer, prompt = await prepare_subquestion(sq, ctx)
+        if answer:
+            return answer
+        try:
+            answer=(await get_answer_llm().ainvoke(prompt)).strip()
+        except Exception as e:
+            return fallback_answer(ctx,e)
+        answer_cache.store(ctx.cache_key,answer)
+        return answer
+    return await in_flight.do(flight_key(sq,ctx),compute)
+
+async def fast_path(q_text: str):
+    """
+    Whole-question answers that need no retrieval or LLM (FAQ, math, greetings, identity).
+    Fee questions are answered per sub-question, so "fees for LKG and who is the principal?" gets both.
+    Returns (answer, record) where record says whether the turn goes into history/memory.
+    """
+    if resp:=faq_engine.lookup_exact(q_text):
+        return resp, True
+    route=route_query(q_text)
+    if expr:=math_expression(q_text):
+        if math_result:=await run_cpu(math_engine.solve,expr):
+            return math_result, True
+    if resp:=check_greeting(route):
+        return resp, False
+    if resp:=check_farewell(route):
+        return resp, False
+    if resp:=await detect_emotion(q_text, route):
+        return resp, False
+    if "self_identity" in route.intents:
+        return "I'm Brightly — your friendly ABC Senior Secondary School assistant.", True
+    if "help" in route.intents and route.small_talk:
+        return random.choice(["I can help you with school details, fees, admissions, exams, and staff information.",
+                              "I assist with queries about ABC Senior Secondary School — like fees, staff, or classes.",
+                              "I provide details about school activities, admissions, and academic info.",
+                              "I’m here to share school-related information and help you find what you need!"]), True
+    return None, False
+
+_background_tasks = set()
+
+def record_turn(session: Session, question: str, answer: str, ctx: QueryContext | None = None) -> int:
+    """
+    Log the turn in the session now (returns its cursor); the memory insert (may
+    need an embedding) runs in the background.
+    """
+    cursor = session.add_turn(question, answer)
+    task = asyncio.create_task(remember(session, question, answer, ctx))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return cursor
+
+def _turn_response(session: Session, answer: str) -> dict:
+    """Only the new answer and where it sits; older turns come from GET /session/{id}/history."""
+    return {"answer":answer,"session_id":session.id,"cursor":session.total}
+
 # ======================
 # Ask endpoint
 # ======================
 @app.post("/ask")
 async def ask(query: Query):
-    q_text=query.question.strip()
-    final_answers=[]
-    math_regex = re.compile(r"d/dx|dx|differentiate|derive|integrate|roots|equation|simplify|sin|cos|tan|log|sqrt|=|[\d+\-*/^()]")
-    if math_regex.search(q_text):
-        step_result=explain_math_step_by_step(q_text)
-        if step_result:
-            add_to_memory(q_text,step_result)
-            conversation_history.append({"question":q_text,"answer":step_result})
-            return JSONResponse({"answer":step_result,"history":conversation_history})
-        math_result=solve_math_expression(q_text)
-        if math_result:
-            add_to_memory(q_text,math_result)
-            conversation_history.append({"question":q_text,"answer":math_result})
-            return JSONResponse({"answer":math_result,"history":conversation_history})
-    if resp:=check_greeting(q_text):
-        return JSONResponse({"answer":resp,"history":conversation_history})
-    if resp:=check_farewell(q_text):
-        return JSONResponse({"answer":resp,"history":conversation_history})
-    if resp:=detect_emotion(q_text):
-        return JSONResponse({"answer":resp,"history":conversation_history})
-    answer=None
-    lower_q=q_text.lower()
-    if any(phrase in lower_q for phrase in INTENT_MAP["self_identity"]):
-        answer="I'm Brightly — your friendly ABC Senior Secondary School assistant."
-    elif any(word in lower_q for word in ["provide","offer","help","assist","what can you"]):
-        answer=random.choice(["I can help you with school details, fees, admissions, exams, and staff information.",
-                              "I assist with queries about ABC Senior Secondary School — like fees, staff, or classes.",
-                              "I provide details about school activities, admissions, and academic info.",
-                              "I’m here to share school-related information and help you find what you need!"])
+    with deadline(ASK_DEADLINE_S):
+        return await _ask(query.question.strip(),session_store.get(query.session_id))
+
+async def _ask(q_text: str, session: Session):
+    answer,record=await fast_path(q_text)
     if answer:
-        add_to_memory(q_text,answer)
-        conversation_history.append({"question":q_text,"answer":answer})
-        return JSONResponse({"answer":answer,"history":conversation_history})
+        if record:
+            record_turn(session,q_text,answer)
+        return JSONResponse(_turn_response(session,answer))
     sub_qs=split_subquestions(q_text)
-    simple_math_questions={"quadratic equations":"A quadratic equation is of the form ax² + bx + c = 0. The solutions are x = [-b ± √(b² - 4ac)] / 2a."}
-    for sq in sub_qs:
-        answer=None
-        for key,val in simple_math_questions.items():
-            if key in sq.lower():
-                answer=val
-                break
-        if not answer and math_regex.search(sq):
-            step_result=explain_math_step_by_step(sq)
-            answer=step_result or solve_math_expression(sq)
-        if not answer:
-            context=""
-
-            for store_name,retriever in vector_stores.items():
-                try:
-                    results=safe_retrieve(retriever,sq)
-                    if results:
-                        context+="\n".join([doc.page_content for doc in results])+"\n"
-                except Exception as e:
-                    log.warning(f"⚠️ Retriever '{store_name}' error: {e}")
-            conv_context=retrieve_relevant_memory(sq)
-            if conv_context:
-                context+="\n--- Previous conversation ---\n"+conv_context
-            if not context.strip():
-                context="No data found."
-            prompt = f"""
-You are Brightly, the official AI assistant of ABC school, Chennai.
-in 2026
-RULES:
-- Answer School content ONLY using the retrieved context below but if the question is based on ncert, educational thing then give answer directly without from the context.
-- If the School info is not in context: "I currently don’t have that information in my records 
-- Allowed topics: school info, facilities, fees, reopening, events, NCERT Physics/Chemistry/Maths (6–12).
-- Not allowed: politics, religion, controversial topics. If asked:
-  "I’m not allowed to discuss that. I can help with school-related queries instead."
-- use emojis of your own where ever possible
-- you should give answers to maths, physics , chemistry questions even though they are unrelated .
-
-FORMATTING (chat bubble):
-- Max line width: 200 px.
-- the font used in the ui is comic sans ms
-- Use short lines and frequent line breaks.
-- One idea per line; no large paragraphs.
-- Never exceed 8 lines unless needed.
-- Highlight key terms with **bold**.
-- Use spacing exactly like this:
-
- **Title / Summary** (do this also when asked about fee structure)
-
-• short point
-
-• short point
-
-• short point
-
-🟡 Ask if the user wants more.
-
-FORMULA FORMAT:
-**Name**:
-\( formula \)
-(short meaning)
-
-META QUESTIONS:
-If the user asks "what did I ask now?" respond with the exact previous user message.
-
-TONE:
-Friendly, simple, helpful, school-appropriate.
-
-CONTEXT:
-{context}
-
-USER QUESTION:
-{sq}
-
-FINAL ANSWER (apply all rules above):
-"""
+    ctxs=[QueryContext(sq,session) for sq in sub_qs]
+    slots=asyncio.Semaphore(SUBQUESTION_CONCURRENCY)
+    async def bounded(sq,ctx):
+        async with slots:
+            return await answer_subquestion(sq,ctx)
+    final_answers=await asyncio.gather(*(bounded(sq,ctx) for sq,ctx in zip(sub_qs,ctxs)))
+    for sq,ctx,answer in zip(sub_qs,ctxs,final_answers):
+        record_turn(session,sq,answer,ctx)
+    return JSONResponse(_turn_response(session,"\n".join(final_answers)))
+
+def _sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def _pump(sq: str, ctx: QueryContext, slots: asyncio.Semaphore, queue: asyncio.Queue):
+    """Feed one sub-question's answer into `queue` chunk by chunk; None marks the end."""
+    streamed=False
+    async def compute():
+        nonlocal streamed
+        streamed=True
+        answer, prompt = await prepare_subquestion(sq, ctx)
+        if answer:
+            await queue.put(answer)
+            return answer
+        parts=[]
+        try:
+            async for chunk in get_answer_llm().astream(prompt):
+                parts.append(chunk)
+                await queue.put(chunk)
+        except Exception as e:
+            if parts:
+                raise
+            answer=fallback_answer(ctx,e)
+            await queue.put(answer)
+            return answer
+        answer="".join(parts).strip()
+        answer_cache.store(ctx.cache_key,answer)
+        return answer
+    try:
+        # The slot is held until the LLM stream ends, as /ask holds it for the whole answer.
+        # A request asking the same thing as one already streaming gets its finished answer in one chunk.
+        async with slots:
+            answer=await in_flight.do(flight_key(sq,ctx),compute)
+        if not streamed:
+            await queue.put(answer)
+    except Exception as e:
+        log.warning(f"⚠️ LLM stream error: {e}")
+        await queue.put(LLM_ERROR_ANSWER)
+    finally:
+        await queue.put(None)
+
+@app.post("/ask/stream")
+async def ask_stream(query: Query):
+    """
+    Server-Sent Events flavour of /ask: `delta` events carry answer text as it is
+    generated, a final `done` event carries the full answer, session id and cursor.
+    Fast-path answers are sent as a single `done` event.
+    """
+    with deadline(ASK_DEADLINE_S):  # also covers the tasks started below
+        return await _ask_stream(query.question.strip(),session_store.get(query.session_id))
+
+async def _ask_stream(q_text: str, session: Session):
+    headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"}
+    answer,record=await fast_path(q_text)
+    if answer:
+        if record:
+            record_turn(session,q_text,answer)
+        async def single():
+            yield _sse({"type":"done",**_turn_response(session,answer)})
+        return StreamingResponse(single(),media_type="text/event-stream",headers=headers)
 
-            try:
-                answer=get_answer_llm().invoke(prompt).strip()
-            except Exception as e:
-                log.warning(f"⚠️ LLM error: {e}")
-                answer="I’m having trouble accessing the data at the moment, please try again."
-        add_to_memory(sq,answer)
-        conversation_history.append({"question":sq,"answer":answer})
-        final_answers.append(answer)
-    return JSONResponse({"answer":"\n".join(final_answers),"history":conversation_history})
+    sub_qs=split_subquestions(q_text)
+    ctxs=[QueryContext(sq,session) for sq in sub_qs]
+    slots=asyncio.Semaphore(SUBQUESTION_CONCURRENCY)
+    queues=[asyncio.Queue() for _ in sub_qs]
+    # All sub-questions generate concurrently; output is drained in question order.
+    tasks=[asyncio.create_task(_pump(sq,ctx,slots,q)) for sq,ctx,q in zip(sub_qs,ctxs,queues)]
+
+    async def events():
+        answers=[]
+        try:
+            for i,(sq,ctx,queue) in enumerate(zip(sub_qs,ctxs,queues)):
+                if i:
+                    yield _sse({"type":"delta","text":"\n"})
+                parts=[]
+                while (chunk:=await queue.get()) is not None:
+                    parts.append(chunk)
+                    yield _sse({"type":"delta","text":chunk})
+                answer="".join(parts).strip()
+                answers.append(answer)
+                record_turn(session,sq,answer,ctx)
+            yield _sse({"type":"done",**_turn_response(session,"\n".join(answers))})
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(events(),media_type="text/event-stream",headers=headers)
+
+# ======================
+# Sessions
+# ======================
+HISTORY_PAGE_MAX=100
+
+class SessionEnd(BaseModel):
+    session_id: str | None = None
+
+@app.get("/session/{session_id}/history")
+def session_history(session_id: str, cursor: int | None = None, limit: int = 20):
+    """
+    Up to `limit` turns before `cursor` (default: the latest), oldest first;
+    pass `next_cursor` back to page further into the past.
+    """
+    if (session:=session_store.find(session_id)) is None:
+        return JSONResponse({"error":"Session not found"},status_code=404)
+    turns,next_cursor=session.history(cursor,max(1,min(limit,HISTORY_PAGE_MAX)))
+    return {"session_id":session.id,"turns":turns,"next_cursor":next_cursor,"cursor":session.total}
+
+@app.post("/session/end")
+def session_end(body: SessionEnd):
+    """Called by the chat widget's unload beacon; the session's turns and memory are dropped."""
+    return {"ok":session_store.end(body.session_id)}
 
 # ======================
 # Sessions persistence
@@ -899,7 +1266,7 @@ def start_new_session():
 
 def save_session_data(session_file):
     try:
-        data_to_save=[{"question":q["question"],"answer":q["answer"]} for q in session_memory[-50:]]
+        data_to_save=session_store.export(50)
         with open(session_file,"w",encoding="utf-8") as f:
             json.dump(data_to_save,f,ensure_ascii=False,indent=2)
     except Exception as e:
@@ -917,14 +1284,45 @@ def cleanup_old_sessions(max_files=10):
 # ======================
 # Startup / Shutdown
 # ======================
-from fastapi import FastAPI
-from vector import load_vector_store
-
-vector_store = None
+async def warm_up():
+    """
+    Build FAQ vectors and the vector index in the serving process, then flip /ready.
+    A failed sync or load is recorded as stage "failed" and retried with backoff
+    until one succeeds. An empty bucket is a finished warm-up (FAQ answers still
+    work; the next upload indexes itself).
+    """
+    WARMUP["started_s"] = _since_start()
+    def progress(stage):
+        WARMUP["stage"] = stage
+    WARMUP["stage"] = "faq"
+    await run_in_threadpool(refresh_faq)
+    try:
+        await run_in_threadpool(warm_tokenizer)
+    except Exception as e:
+        log.warning(f"⚠️ Tokenizer warm-up failed: {e}")
+    delay = WARMUP_RETRY_S
+    while True:
+        try:
+            await run_in_threadpool(refresh_vector_stores, progress)
+        except Exception as e:
+            WARMUP["stage"] = "failed"
+            WARMUP["error"] = str(e)
+            log.warning(f"⚠️ Warm-up failed: {e}; retrying in {delay:g}s")
+        else:
+            WARMUP.update(stage="ready", error=None, ready=True, ready_s=_since_start())
+            if not vector_stores:
+                log.warning("⚠️ Warm-up finished with no documents indexed")
+            log.info(f"✅ Warm-up finished in {WARMUP['ready_s'] - WARMUP['started_s']:.2f}s "
+                     f"({WARMUP['ready_s']}s after process start)")
+            return
+        finally:
+            index_ready.set()  # requests stop waiting after the first attempt, loaded or not
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WARMUP_RETRY_MAX_S)
 
 @app.on_event("startup")
 async def startup_event():
-    global vector_store, SESSION_DIR
+    global SESSION_DIR
 
     # --- Ensure sessions directory exists ---
     os.makedirs(SESSION_DIR, exist_ok=True)
@@ -934,25 +1332,25 @@ async def startup_event():
     log.info("🚀 Server starting up...")
     log.info(f"   Project = {GOOGLE_CLOUD_PROJECT}")
     log.info(f"   Location = {GOOGLE_CLOUD_LOCATION}")
-    log.info(f"   Refresh vectors on startup = {REFRESH_VECTORS_ON_STARTUP}")
 
-    # --- Load Vector DB (non-blocking: may still be warming) ---
-    vector_store = load_vector_store()  # returns None until ready
-    log.info("📦 Vector store loaded (or warming).")
+    # --- Verified FAQ answers (exact matches work immediately) ---
+    faq_engine.load()
+
+    # --- Sympy worker processes (import sympy while the index warms) ---
+    math_engine.start()
 
     # --- Cleanup any old junk session files ---
     cleanup_old_sessions(max_files=10)
 
-    # --- Optional vector refresh ---
-    if REFRESH_VECTORS_ON_STARTUP:
-        refresh_vector_stores()
-        log.info("✅ Vector stores + NCERT data loaded.")
-    else:
-        log.info("⏭️ Skipping vector refresh/load on startup.")
+    # --- Vector index + FAQ vectors warm up in the background; see GET /ready ---
+    app.state.warm_up = asyncio.create_task(warm_up())
+    log.info(f"📦 Serving after {_since_start()}s; vector index warming in background.")
 
 @app.on_event("shutdown")
 def shutdown_event():
     global SESSION_FILE
+    if (task := getattr(app.state, "warm_up", None)) is not None:
+        task.cancel()  # may be waiting to retry a failed warm-up
     os.makedirs(SESSION_DIR, exist_ok=True)
 
     if SESSION_FILE is None:
@@ -961,6 +1359,7 @@ def shutdown_event():
     save_session_data(SESSION_FILE)
     cleanup_old_sessions(max_files=10)
     log.info(f"Session saved: {SESSION_FILE}")
+    math_engine.stop()
 
 
 # ======================
@@ -0,0 +1,212 @@
+"""
+Local BM25 inverted index over the same chunks as the FAISS index, plus
+reciprocal rank fusion for hybrid retrieval.
+
+Built in memory from the chunk store whenever vector.load_vector_store
+publishes a new index. Many school questions are keyword-exact (names,
+"XI-CS", "bus route 7"); when the lexical top hit is confident the caller
+can skip the embeddings call altogether (see BM25Index.confident).
+"""
+import os
+import re
+import math
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# ------------------ CONFIG ------------------ #
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+# Confident = the top chunk holds this share of the query's idf mass and beats the runner-up by this factor.
+BM25_CONFIDENT_COVERAGE = float(os.getenv("BM25_CONFIDENT_COVERAGE", "0.8"))
+BM25_CONFIDENT_MARGIN = float(os.getenv("BM25_CONFIDENT_MARGIN", "1.3"))
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it me my of on or please tell "
+    "that the their there this to was what when where which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(*rankings: Sequence[int], k: int = RRF_K) -> List[int]:
+    """Merge ranked row lists: score(row) = Σ 1 / (k + rank)."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda row: -scores[row])
+
+
+# ------------------ Index ------------------ #
+class BM25Index:
+    def __init__(self, docs: Iterable[Tuple[str, str]], k1: float = BM25_K1, b: float = BM25_B):
+        """`docs` yields (text, source) in row order, matching the FAISS rows."""
+        self.k1 = k1
+        self.b = b
+        self.sources: List[str] = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for row, (text, source) in enumerate(docs):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            self.sources.append(source)
+            for term, tf in Counter(tokens).items():
+                self._postings.setdefault(term, []).append((row, tf))
+        self._lengths = lengths
+        self.n = len(lengths)
+        self._avgdl = (sum(lengths) / self.n) if self.n else 0.0
+        self._idf = {t: math.log(1 + (self.n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in self._postings.items()}
+        self._max_idf = math.log(1 + (self.n + 0.5) / 0.5) if self.n else 0.0
+
+    @classmethod
+    def from_chunks(cls, chunks) -> "BM25Index":
+        """Build from an index_store.ChunkStore (reads every record once)."""
+        return cls((rec["text"], rec["source"]) for rec in (chunks.get(i) for i in range(len(chunks))))
+
+    def __len__(self):
+        return self.n
+
+    def search(self, query: str, k: int = 3, accept: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, float]]:
+        """Best `k` (row, score) pairs, highest first."""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for row, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[row] / self._avgdl)
+                scores[row] = scores.get(row, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda kv: -kv[1])
+        if accept is not None:
+            ranked = [(row, s) for row, s in ranked if accept(row)]
+        return ranked[:k]
+
+    def confident(self, query: str, hits: Sequence[Tuple[int, float]]) -> bool:
+        """
+        True when the top hit alone contains most of what the query asks for: its
+        matched terms carry >= BM25_CONFIDENT_COVERAGE of the query's idf mass
+        (unknown terms count at the maximum idf) and it outscores the runner-up
+        by BM25_CONFIDENT_MARGIN.
+        """
+        terms = set(tokenize(query))
+        if not hits or not terms:
+            return False
+        top = hits[0][0]
+        total = matched = 0.0
+        for term in terms:
+            postings = self._postings.get(term)
+            weight = self._idf[term] if postings else self._max_idf
+            total += weight
+            if postings and any(row == top for row, _ in postings):
+                matched += weight
+        if matched / total < BM25_CONFIDENT_COVERAGE:
+            return False
+        return len(hits) == 1 or hits[0][1] >= BM25_CONFIDENT_MARGIN * hits[1][1]
+
+
+# ------------------ CLI Benchmark ------------------ #
+# Fixture corpus: one fact per chunk, with keyword-exact and paraphrased queries.
+FIXTURE = {
+    "bus7": "Bus route 7 covers Velachery, Madipakkam and Nanganallur. Pickup starts at 7:05 am; driver Mr. Ravi, 98400 11223.",
+    "bus3": "Bus route 3 covers Adyar, Thiruvanmiyur and Besant Nagar. Pickup starts at 6:55 am.",
+    "bus12": "Bus route 12 covers Tambaram and Chromepet. Pickup starts at 6:40 am; transport fee is billed per term.",
+    "principal": "The Principal is Smt. Sripriya Rajarajan, M.Sc. (Physics), M.Phil. She meets parents on Saturdays 10-12.",
+    "vice": "The Vice Principal is Mr. K. Sundaram, who coordinates examinations and the academic calendar.",
+    "xics": "XI-CS (Computer Science) is taught by Mrs. Lakshmi Narayanan; Python and SQL labs run on Tuesdays.",
+    "xibio": "XI-BIO students take Biology with Dr. Meena Iyer; dissection practicals are held in Lab 2.",
+    "timings": "School hours are 8:00 am to 3:15 pm, Monday to Friday. Saturdays are half days until 12:30 pm.",
+    "reopen": "After the summer vacation the school reopens on 3 June. Orientation for new students is on 2 June.",
+    "uniform": "Uniform: white shirt, navy blue trousers or pinafore, black shoes. House T-shirts on Wednesdays.",
+    "library": "The library has 12,000 books and opens from 7:45 am. Students may borrow two books for two weeks.",
+    "sports": "Sports facilities include a basketball court, a 200 m track, table tennis and a skating rink.",
+    "admission": "Admissions for LKG open in November. Applications are collected at the front office with a birth certificate.",
+    "exams": "Term 1 examinations start on 15 September; Term 2 examinations start on 2 December.",
+    "canteen": "The canteen serves vegetarian lunch; monthly meal passes can be bought at the accounts office.",
+    "address": "Modern Senior Secondary School, 11 Fourth Main Road, Nanganallur, Chennai 600061. Phone 044-22241234.",
+    "lab": "Science labs for Physics, Chemistry and Biology are equipped for CBSE practicals from class 9 to 12.",
+    "clubs": "Clubs include robotics, eco club, quiz club and Carnatic music; they meet on Friday afternoons.",
+}
+QUERIES = [
+    ("bus route 7 pickup time", "bus7"),
+    ("who teaches XI-CS", "xics"),
+    ("Mrs. Lakshmi Narayanan", "xics"),
+    ("driver phone number for Nanganallur bus", "bus7"),
+    ("who is the principal", "principal"),
+    ("Dr. Meena Iyer", "xibio"),
+    ("phone number of the school", "address"),
+    ("when does school open after the holidays", "reopen"),
+    ("what time does school finish", "timings"),
+    ("what should students wear", "uniform"),
+    ("how can I borrow books", "library"),
+    ("what games can children play", "sports"),
+    ("how to apply for kindergarten", "admission"),
+    ("when are the term 2 exams", "exams"),
+    ("where can kids eat lunch", "canteen"),
+    ("extracurricular activities after class", "clubs"),
+]
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    import numpy as np
+
+    ids = list(FIXTURE)
+    texts = [FIXTURE[i] for i in ids]
+    lexical = BM25Index((t, "fixture.txt") for t in texts)
+
+    if "--offline" in sys.argv:
+        # Stand-in: hashed character trigrams. Not semantic; only exercises the fusion path.
+        def embed(batch):
+            out = np.zeros((len(batch), 512), dtype=np.float32)
+            for r, t in enumerate(batch):
+                t = f"  {t.lower()}  "
+                for i in range(len(t) - 2):
+                    out[r, hash(t[i:i + 3]) % 512] += 1
+            return out / np.linalg.norm(out, axis=1, keepdims=True)
+        label = "trigram stand-in embeddings"
+    else:
+        from openai import OpenAI
+        from embeddings import embed_batched
+
+        client, model = OpenAI(), os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+        embed = lambda batch: np.asarray(embed_batched(client, model, batch, 1536), dtype=np.float32)
+        label = model
+
+    doc_vecs = embed(texts)
+    query_vecs = embed([q for q, _ in QUERIES])
+
+    def vector_rows(i, n):
+        d = ((doc_vecs - query_vecs[i]) ** 2).sum(axis=1)
+        return list(np.argsort(d)[:n])
+
+    def lexical_rows(q, n):
+        return [row for row, _ in lexical.search(q, n)]
+
+    methods = {
+        "lexical": lambda i, q: lexical_rows(q, 3),
+        "vector": lambda i, q: vector_rows(i, 3),
+        "hybrid": lambda i, q: reciprocal_rank_fusion(vector_rows(i, 20), lexical_rows(q, 20))[:3],
+    }
+    print(f"{len(texts)} chunks, {len(QUERIES)} queries, embeddings: {label}")
+    for name, fn in methods.items():
+        hits = sum(1 for i, (q, want) in enumerate(QUERIES) if ids.index(want) in fn(i, q))
+        runs = 200
+        start = time.perf_counter()
+        for _ in range(runs):
+            for i, (q, _) in enumerate(QUERIES):
+                fn(i, q)
+        us = (time.perf_counter() - start) * 1e6 / (runs * len(QUERIES))
+        print(f"{name:8s}: recall@3 {hits}/{len(QUERIES)} = {hits / len(QUERIES):.2f}, "
+              f"{us:7.1f} µs/query (+ embeddings call for vector/hybrid)")
+
+    confident = [(q, want) for q, want in QUERIES if lexical.confident(q, lexical.search(q, 3))]
+    right = sum(1 for q, want in confident if lexical.search(q, 1)[0][0] == ids.index(want))
+    print(f"confident lexical hits (embedding skipped): {len(confident)}/{len(QUERIES)}, top-1 correct {right}/{len(confident)}")
+    for q, _ in confident:
+        print(f"    {q!r}")
@@ -0,0 +1,229 @@
+"""
+Prompt assembly for the /ask LLM call.
+
+The static rules live in SYSTEM_PREFIX and are sent once as the system
+message, identical on every request. build_context() turns ranked retrieval
+hits and past turns into the per-request CONTEXT block:
+
+    - duplicate chunks (same hash or text) are dropped,
+    - neighbouring split windows of one file (they share up to 150 chars of
+      overlap, see vector._split_text) are stitched back into one passage,
+    - passages are packed best-first into CONTEXT_TOKEN_BUDGET tokens and
+      conversation turns into MEMORY_TOKEN_BUDGET.
+"""
+import os
+from typing import Iterable, List, Sequence, Tuple
+
+from embeddings import count_tokens
+
+# ------------------ CONFIG ------------------ #
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "400"))
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "5"))
+CONTEXT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
+MIN_OVERLAP = 20      # shortest shared edge treated as a split-window overlap
+MAX_OVERLAP = 400
+
+NO_CONTEXT = "No data found."
+
+SYSTEM_PREFIX = """
+You are Brightly, the official AI assistant of ABC school, Chennai.
+in 2026
+RULES:
+- Answer School content ONLY using the retrieved context below but if the question is based on ncert, educational thing then give answer directly without from the context.
+- If the School info is not in context: "I currently don’t have that information in my records
+- Allowed topics: school info, facilities, fees, reopening, events, NCERT Physics/Chemistry/Maths (6–12).
+- Not allowed: politics, religion, controversial topics. If asked:
+  "I’m not allowed to discuss that. I can help with school-related queries instead."
+- use emojis of your own where ever possible
+- you should give answers to maths, physics , chemistry questions even though they are unrelated .
+
+FORMATTING (chat bubble):
+- Max line width: 200 px.
+- the font used in the ui is comic sans ms
+- Use short lines and frequent line breaks.
+- One idea per line; no large paragraphs.
+- Never exceed 8 lines unless needed.
+- Highlight key terms with **bold**.
+- Use spacing exactly like this:
+
+ **Title / Summary** (do this also when asked about fee structure)
+
+• short point
+
+• short point
+
+• short point
+
+🟡 Ask if the user wants more.
+
+FORMULA FORMAT:
+**Name**:
+\\( formula \\)
+(short meaning)
+
+META QUESTIONS:
+If the user asks "what did I ask now?" respond with the exact previous user message.
+
+TONE:
+Friendly, simple, helpful, school-appropriate.
+""".strip()
+
+
+def user_prompt(context: str, question: str) -> str:
+    """The per-request user message; everything static is in SYSTEM_PREFIX."""
+    return f"CONTEXT:\n{context}\n\nUSER QUESTION:\n{question}\n\nFINAL ANSWER (apply all rules above):"
+
+
+def warm_tokenizer():
+    """Load the tiktoken encoding (may download it) before the first request needs it."""
+    count_tokens("", CONTEXT_MODEL)
+
+
+# ------------------ Dedupe / Merge ------------------ #
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b` (0 if under MIN_OVERLAP)."""
+    if len(a) < MIN_OVERLAP or len(b) < MIN_OVERLAP:
+        return 0
+    head = b[:MIN_OVERLAP]
+    start = a.find(head, max(0, len(a) - MAX_OVERLAP))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(head, start + 1)
+    return 0
+
+
+def dedupe_passages(docs: Iterable) -> List[Tuple[str, str]]:
+    """
+    Ranked Documents -> ranked (source, text) passages with duplicates dropped
+    and overlapping windows of the same file merged at the better-ranked slot.
+    """
+    passages: List[Tuple[str, str]] = []
+    seen = set()
+    for doc in docs:
+        text = doc.page_content.strip()
+        meta = getattr(doc, "metadata", None) or {}
+        key = meta.get("hash") or text
+        if not text or key in seen:
+            continue
+        seen.add(key)
+        source = meta.get("source") or ""
+        passages.append((source, text))
+
+    merged = True
+    while merged:
+        merged = False
+        for i, (src_a, a) in enumerate(passages):
+            for j, (src_b, b) in enumerate(passages):
+                if i == j or src_a != src_b:
+                    continue
+                if b in a:
+                    n = len(b)
+                elif n := _overlap(a, b):
+                    pass
+                else:
+                    continue
+                keep, drop = min(i, j), max(i, j)
+                passages[keep] = (src_a, a + b[n:])
+                del passages[drop]
+                merged = True
+                break
+            if merged:
+                break
+    return passages
+
+
+# ------------------ Packing ------------------ #
+def pack(texts: Sequence[str], budget: int, model: str = CONTEXT_MODEL) -> List[str]:
+    """Best-first texts that fit in `budget` tokens; the first one is trimmed if it alone is too long."""
+    packed: List[str] = []
+    used = 0
+    for text in texts:
+        n = count_tokens(text, model)
+        if used + n > budget:
+            if packed or not n:
+                continue
+            text, n = text[: len(text) * budget // n], budget
+        packed.append(text)
+        used += n
+    return packed
+
+
+def build_context(
+    docs: Iterable,
+    turns: Sequence[Tuple[str, str]] = (),
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    memory_budget: int = MEMORY_TOKEN_BUDGET,
+    model: str = CONTEXT_MODEL,
+) -> str:
+    """CONTEXT block from ranked retrieval hits and (question, answer) turns, most relevant first."""
+    passages = pack([text for _, text in dedupe_passages(docs)], budget, model)
+    history = pack(list(dict.fromkeys(f"Q: {q}\nA: {a}" for q, a in turns)), memory_budget, model)
+    context = "\n\n".join(passages)
+    if history:
+        context += "\n--- Previous conversation ---\n" + "\n".join(history)
+    return context.strip() or NO_CONTEXT
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    import sys
+    import time
+    from types import SimpleNamespace
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    from bm25 import FIXTURE
+
+    # A handbook long enough to split into overlapping windows, as vector._split_text does.
+    handbook = "\n".join(f"{key.upper()} ({part}): {line}" for part in ("2024", "2025", "2026")
+                         for key, text in FIXTURE.items() for line in text.split(". "))
+    windows = RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=150).split_text(handbook)
+    doc = lambda i, source="handbook.txt": SimpleNamespace(page_content=windows[i],
+                                                           metadata={"source": source, "hash": f"h{i}"})
+    # Ranked hits for one question: the best window, its neighbour, the best window's text
+    # again from a copied file, and two more candidates.
+    hits = [doc(3), doc(4), doc(3, "handbook_copy.txt"), doc(0), doc(5)]
+    answer = "**School Timings** 🕗\n\n• Classes run 8:00 am to 3:15 pm\n\n• Saturdays end at 12:30 pm\n\n🟡 Want more?"
+    turns = [("what are the school timings", answer)] * 2 + [
+        (f"question {i} about the school", answer + " Extra details. " * 8) for i in range(3)]
+    question = "when does the bus for route 7 leave and what time does school start"
+
+    def legacy_prompt():
+        # Assembly before this module: first 3 hits concatenated, top-5 turns, rules in the user message.
+        context = "\n".join(d.page_content for d in hits[:3]) + "\n"
+        context += "\n--- Previous conversation ---\n" + "\n".join(f"Q: {q}\nA: {a}" for q, a in turns)
+        system = ("You are Brightly, the official AI assistant of ABC Senior Secondary School, Chennai. "
+                  "Answer in a concise, helpful, teacher-style manner.")
+        return system, f"\n{SYSTEM_PREFIX}\n\nCONTEXT:\n{context}\n\nUSER QUESTION:\n{question}\n\nFINAL ANSWER (apply all rules above):\n"
+
+    def new_prompt():
+        return SYSTEM_PREFIX, user_prompt(build_context(hits, turns), question)
+
+    tokens = lambda text: count_tokens(text, CONTEXT_MODEL)
+    print(f"{len(windows)} windows of handbook.txt, {len(hits)} hits, {len(turns)} memory turns")
+    results = {}
+    for name, fn in (("before", legacy_prompt), ("after", new_prompt)):
+        system, user = fn()
+        runs = 500
+        start = time.perf_counter()
+        for _ in range(runs):
+            fn()
+        build_ms = (time.perf_counter() - start) * 1000 / runs
+        results[name] = (system, user)
+        print(f"{name:6s}: system {tokens(system):5d} + user {tokens(user):5d} = {tokens(system) + tokens(user):5d} "
+              f"prompt tokens (static prefix {tokens(system) if name == 'after' else 0}), assembly {build_ms:.2f} ms")
+
+    if "--live" in sys.argv:
+        from openai import OpenAI
+
+        client = OpenAI()
+        for name, (system, user) in results.items():
+            start = time.perf_counter()
+            resp = client.chat.completions.create(
+                model=CONTEXT_MODEL, temperature=0.2, max_tokens=300,
+                messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+            )
+            print(f"{name:6s}: LLM {(time.perf_counter() - start) * 1000:.0f} ms, "
+                  f"usage prompt={resp.usage.prompt_tokens} completion={resp.usage.completion_tokens}")
@@ -0,0 +1,248 @@
+"""
+On-disk embedding cache shared by the query path (api.OpenAIEmbedder) and the
+index build (vector.CachedEmbeddings).
+
+One cache per (model, dimensions). Vectors live in a memory-mapped float32
+matrix (<model>-<dim>.f32); a JSON sidecar maps sha256(text) -> row and keeps
+the LRU order, so unchanged chunks and repeated questions never hit the API.
+A third mapped file (.keys) holds a 64-bit tag of the key each row was last
+written for; it is updated before the row, and sidecar entries whose row tag
+doesn't match are dropped on open, so a row evicted and rewritten after the
+last flush is never served for its old key.
+
+Inserts only touch memory. A background thread persists the matrix and the
+sidecar every EMBED_CACHE_FLUSH_S seconds (sooner after _FLUSH_EVERY inserts),
+and does the disk I/O outside the lookup lock, so callers on the event loop
+never wait on a flush.
+"""
+import os
+import json
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+log = logging.getLogger("msss")
+
+# ------------------ CONFIG ------------------ #
+CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "embedding_cache")
+MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "20000"))
+EMBED_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+EMBED_DIM = int(os.getenv("OPENAI_EMBEDDING_DIM", "1536"))
+FLUSH_INTERVAL_S = float(os.getenv("EMBED_CACHE_FLUSH_S", "5"))
+
+_INITIAL_ROWS = 256
+_FLUSH_EVERY = 64
+_META_CHUNK = 1000  # sidecar entries encoded per GIL hold
+
+_CACHES: Dict[tuple, "EmbeddingCache"] = {}
+_CACHES_LOCK = threading.Lock()
+_FLUSH_WAKE = threading.Event()
+_flusher: Optional[threading.Thread] = None
+
+
+def _key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _tag(key: str) -> np.uint64:
+    return np.uint64(int(key[:16], 16))
+
+
+def _write_meta(path: str, rows: int, slots: list):
+    """Atomically write the sidecar in chunks, yielding the GIL between them (a 20k-entry dump is ~25 ms of CPU)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(f'{{"rows": {rows}, "slots": [')
+        for i in range(0, len(slots), _META_CHUNK):
+            f.write((", " if i else "") + json.dumps(slots[i:i + _META_CHUNK])[1:-1])
+            time.sleep(0)
+        f.write("]}")
+    os.replace(tmp, path)
+
+
+# ------------------ Cache ------------------ #
+class EmbeddingCache:
+    def __init__(self, model: str, dim: int, cache_dir: str = CACHE_DIR, max_entries: int = MAX_ENTRIES):
+        self.model = model
+        self.dim = dim
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one writer of the files at a time
+        self._slots: "OrderedDict[str, int]" = OrderedDict()  # oldest first
+        self._pending = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.join(cache_dir, f"{model.replace('/', '_')}-{dim}")
+        self._data_path = base + ".f32"
+        self._keys_path = base + ".keys"
+        self._index_path = base + ".json"
+
+        rows = _INITIAL_ROWS
+        slots = []
+        if os.path.exists(self._index_path) and os.path.exists(self._data_path):
+            try:
+                with open(self._index_path, "r") as f:
+                    meta = json.load(f)
+                fits = meta["rows"] <= self.max_entries
+                if fits and os.path.getsize(self._data_path) >= meta["rows"] * dim * 4:
+                    rows = meta["rows"]
+                    slots = [(k, int(s)) for k, s in meta["slots"]]
+            except Exception as e:
+                log.warning(f"⚠️ Embedding cache index unreadable ({e}); starting empty")
+                slots = []
+        tagged = os.path.exists(self._keys_path)
+        self._rows = min(rows, self.max_entries)
+        self._matrix, self._tags = self._map(self._rows)
+        if tagged:
+            self._slots = OrderedDict((k, s) for k, s in slots if self._tags[s] == _tag(k))
+            if len(self._slots) < len(slots):
+                log.warning(f"⚠️ Embedding cache: dropped {len(slots) - len(self._slots)} rows rewritten after the last flush")
+        else:  # cache written before row tags existed
+            self._slots = OrderedDict(slots)
+            for k, s in slots:
+                self._tags[s] = _tag(k)
+        used = set(self._slots.values())
+        self._free = [s for s in range(self._rows - 1, -1, -1) if s not in used]  # pop() takes the lowest
+
+    def _map(self, rows: int):
+        """(vector matrix, row tags) memory maps, growing both files to `rows` rows."""
+        maps = []
+        for path, dtype, shape in ((self._data_path, np.float32, (rows, self.dim)),
+                                   (self._keys_path, np.uint64, (rows,))):
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            maps.append(np.memmap(path, dtype=dtype, mode="r+", shape=shape))
+        return tuple(maps)
+
+    def _slot_for_new(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._rows < self.max_entries:
+            # Both maps share the file's pages, so rows written through the old one carry over.
+            old, self._rows = self._rows, min(self.max_entries, self._rows * 2)
+            self._matrix, self._tags = self._map(self._rows)
+            self._free = list(range(self._rows - 1, old, -1))
+            return old
+        _, slot = self._slots.popitem(last=False)
+        self.evictions += 1
+        return slot
+
+    # ---- lookups ----
+    def get(self, text: str) -> Optional[np.ndarray]:
+        return self.get_many([text])[0]
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for text in texts:
+                k = _key(text)
+                slot = self._slots.get(k)
+                if slot is None:
+                    self.misses += 1
+                    out.append(None)
+                    continue
+                self._slots.move_to_end(k)
+                self.hits += 1
+                out.append(np.array(self._matrix[slot]))
+        return out
+
+    # ---- inserts ----
+    def put(self, text: str, vector: Sequence[float]):
+        self.put_many([text], [vector])
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        with self._lock:
+            for text, vec in zip(texts, vectors):
+                if len(vec) != self.dim:
+                    log.warning(f"⚠️ Not caching {len(vec)}-d vector in {self.dim}-d cache for {self.model}")
+                    continue
+                k = _key(text)
+                slot = self._slots.get(k)
+                if slot is None:
+                    slot = self._slot_for_new()
+                self._slots[k] = slot
+                self._slots.move_to_end(k)
+                self._tags[slot] = _tag(k)  # before the row: a crash in between leaves a mismatch, not a wrong hit
+                self._matrix[slot] = np.asarray(vec, dtype=np.float32)
+                self._pending += 1
+            if self._pending >= _FLUSH_EVERY:
+                _FLUSH_WAKE.set()
+
+    # ---- persistence ----
+    def flush(self):
+        """Write pending rows and the slot map; lookups and inserts continue meanwhile."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, 0
+                matrix, tags, rows, slots = self._matrix, self._tags, self._rows, list(self._slots.items())
+            try:
+                matrix.flush()
+                tags.flush()
+                _write_meta(self._index_path, rows, slots)
+            except Exception:
+                with self._lock:
+                    self._pending += pending
+                raise
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "model": self.model,
+            "dim": self.dim,
+            "entries": len(self._slots),
+            "capacity": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# ------------------ Registry ------------------ #
+def get_cache(model: str = EMBED_MODEL, dim: int = EMBED_DIM) -> EmbeddingCache:
+    global _flusher
+    with _CACHES_LOCK:
+        cache = _CACHES.get((model, dim))
+        if cache is None:
+            cache = _CACHES[(model, dim)] = EmbeddingCache(model, dim)
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="embed-cache-flush", daemon=True)
+            _flusher.start()
+        return cache
+
+
+def _flush_loop():
+    while True:
+        _FLUSH_WAKE.wait(FLUSH_INTERVAL_S)
+        _FLUSH_WAKE.clear()
+        flush_all()
+
+
+def cache_stats() -> List[dict]:
+    with _CACHES_LOCK:
+        return [c.stats() for c in _CACHES.values()]
+
+
+@atexit.register
+def flush_all():
+    with _CACHES_LOCK:
+        caches = list(_CACHES.values())
+    for cache in caches:
+        try:
+            cache.flush()
+        except Exception as e:
+            log.warning(f"⚠️ Embedding cache flush failed: {e}")
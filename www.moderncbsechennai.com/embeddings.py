@@ -0,0 +1,148 @@
+"""
+Batched calls to the OpenAI embeddings endpoint.
+
+Texts are packed into token-budgeted requests (counted with tiktoken) and the
+requests run on a small thread pool, each through the model's governor (so they
+share its concurrency limit, retries and breaker with the live API calls);
+results come back in input order. Used by
+api.OpenAIEmbedder.embed_documents and by the FAISS index build in vector.py.
+"""
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence
+
+from governor import governor
+
+log = logging.getLogger("msss")
+
+# ------------------ CONFIG ------------------ #
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "50000"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "512"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+EMBED_BATCH_TIMEOUT_S = float(os.getenv("EMBED_BATCH_TIMEOUT_S", "60"))
+MAX_INPUT_TOKENS = 8191  # per-input limit of the embeddings endpoint
+
+_ENCODINGS = {}
+
+
+# ------------------ Token Counting ------------------ #
+def _encoding(model: str):
+    if model not in _ENCODINGS:
+        try:
+            import tiktoken
+            try:
+                _ENCODINGS[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _ENCODINGS[model] = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            log.warning(f"⚠️ tiktoken unavailable ({e}); estimating tokens from length")
+            _ENCODINGS[model] = None
+    return _ENCODINGS[model]
+
+
+def _fit(text: str, model: str):
+    """Return (text, token_count), truncating inputs over the per-input limit."""
+    enc = _encoding(model)
+    if enc is None:
+        text = text[: MAX_INPUT_TOKENS * 3]
+        return text, max(1, len(text) // 3)
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) > MAX_INPUT_TOKENS:
+        tokens = tokens[:MAX_INPUT_TOKENS]
+        text = enc.decode(tokens)
+    return text, len(tokens)
+
+
+def count_tokens(text: str, model: str) -> int:
+    enc = _encoding(model)
+    if enc is None:
+        return max(1, len(text) // 3) if text else 0
+    return len(enc.encode(text, disallowed_special=()))
+
+
+# ------------------ Request Args ------------------ #
+def dimension_args(model: str, dim: int) -> dict:
+    """`dimensions=` for models that can shorten their output (text-embedding-3-*); ada-002 rejects it."""
+    return {"dimensions": dim} if model.startswith("text-embedding-3") else {}
+
+
+# ------------------ Packing ------------------ #
+def pack_batches(
+    texts: Sequence[str],
+    model: str,
+    max_tokens: int = EMBED_BATCH_TOKENS,
+    max_items: int = EMBED_BATCH_SIZE,
+):
+    """
+    Greedily pack texts into requests of at most `max_tokens` tokens / `max_items` inputs.
+    Returns a list of (positions, texts) pairs; empty strings are skipped.
+    """
+    batches = []
+    positions: List[int] = []
+    inputs: List[str] = []
+    budget = 0
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        text, n = _fit(text, model)
+        if inputs and (budget + n > max_tokens or len(inputs) >= max_items):
+            batches.append((positions, inputs))
+            positions, inputs, budget = [], [], 0
+        positions.append(i)
+        inputs.append(text)
+        budget += n
+    if inputs:
+        batches.append((positions, inputs))
+    return batches
+
+
+# ------------------ Embedding ------------------ #
+def embed_batched(client, model: str, texts: Sequence[str], dim: int, workers: int = EMBED_WORKERS) -> List[List[float]]:
+    """Embed `texts` in packed, concurrent requests; empty strings map to zero vectors."""
+    out: List[List[float]] = [[0.0] * dim for _ in texts]
+    batches = pack_batches(texts, model)
+    if not batches:
+        return out
+
+    def run(batch):
+        positions, inputs = batch
+        res = governor(model).call_sync(
+            lambda timeout: client.embeddings.create(model=model, input=inputs, timeout=timeout,
+                                                     **dimension_args(model, dim)),
+            EMBED_BATCH_TIMEOUT_S)
+        return positions, [d.embedding for d in sorted(res.data, key=lambda d: d.index)]
+
+    if len(batches) == 1 or workers <= 1:
+        results = map(run, batches)
+    else:
+        pool = ThreadPoolExecutor(max_workers=min(workers, len(batches)), thread_name_prefix="embed")
+        with pool:
+            results = list(pool.map(run, batches))
+    for positions, vectors in results:
+        for i, vec in zip(positions, vectors):
+            out[i] = vec
+    return out
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    from openai import OpenAI
+
+    client = OpenAI()
+    model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+    n = int(os.getenv("BENCH_TEXTS", "200"))
+    texts = [f"Sample chunk {i}: the school bus for route {i % 17} leaves at 7:{i % 60:02d} am." * 8 for i in range(n)]
+
+    start = time.perf_counter()
+    for t in texts:
+        client.embeddings.create(model=model, input=t, **dimension_args(model, 1536))
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    embed_batched(client, model, texts, dim=1536)
+    batched = time.perf_counter() - start
+
+    print(f"per-text: {n / single:8.1f} texts/s ({single:.2f}s)")
+    print(f"batched:  {n / batched:8.1f} texts/s ({batched:.2f}s, {len(pack_batches(texts, model))} requests)")
@@ -0,0 +1,223 @@
+"""
+Local sentiment for chatty /ask messages: Positive / Negative / Neutral.
+
+A small lexicon scorer (word list + emoji, with negation: "not helpful" counts
+as negative) runs in microseconds. Only mixed or unclear messages go to the
+LLM, and every verdict is cached per normalised message.
+"""
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+log = logging.getLogger("msss")
+
+# ------------------ CONFIG ------------------ #
+EMOTION_LLM_THRESHOLD = float(os.getenv("EMOTION_LLM_THRESHOLD", "0.6"))
+EMOTION_CACHE_SIZE = int(os.getenv("EMOTION_CACHE_SIZE", "4096"))
+LABELS = ("Positive", "Negative", "Neutral")
+
+EMOTION_PROMPT = """
+Detect if this message is Positive (appreciation/humor) or Negative (complaint/anger).
+Return only: Positive / Negative / Neutral
+Message: {message}
+"""
+
+# ------------------ Lexicon ------------------ #
+POSITIVE = {
+    "thanks", "thank", "thx", "ty", "awesome", "great", "good", "nice", "cool", "love", "loved", "lovely",
+    "amazing", "wonderful", "excellent", "helpful", "brilliant", "superb", "fantastic", "perfect", "genius",
+    "best", "appreciate", "appreciated", "sweet", "kind", "smart", "wow", "lol", "haha", "hahaha", "lmao",
+    "funny", "glad", "happy", "super", "fab", "cute", "clever", "impressive", "grateful", "well done",
+}
+NEGATIVE = {
+    "bad", "worst", "useless", "hate", "stupid", "terrible", "awful", "angry", "disappointed", "disappointing",
+    "wrong", "poor", "annoying", "annoyed", "rubbish", "pathetic", "slow", "broken", "dumb", "horrible",
+    "waste", "sucks", "idiot", "nonsense", "frustrating", "frustrated", "upset", "irritating", "worse",
+    "ridiculous", "rude", "unhelpful", "complaint", "disgusting", "shame", "fail", "failed",
+}
+POSITIVE_EMOJI = set("😊😄😁😀😃🙂😍🥰❤👍👏🙏🎉🥳😂🤣💯✨🌟💫")
+NEGATIVE_EMOJI = set("😠😡🤬😞😢😭👎💔😤😒🙄😩😫")
+NEGATORS = {"not", "no", "never", "isn't", "isnt", "wasn't", "wasnt", "don't", "dont", "doesn't", "doesnt",
+            "didn't", "didnt", "aren't", "arent", "nothing", "hardly", "without"}
+
+_WORD = re.compile(r"[a-z']+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_message(text: str) -> str:
+    """Cache key: lower-case, single spaces, no trailing punctuation (emoji kept)."""
+    return _SPACES.sub(" ", text.lower()).strip().rstrip("!?.,~ ")
+
+
+def score(text: str) -> Tuple[str, float]:
+    """Lexicon verdict and a 0..1 confidence. Mixed signals give low confidence."""
+    words = _WORD.findall(text.lower())
+    pos = neg = 0
+    for i, word in enumerate(words):
+        bigram = f"{words[i - 1]} {word}" if i else ""
+        if word in POSITIVE or bigram in POSITIVE:
+            polarity = 1
+        elif word in NEGATIVE:
+            polarity = -1
+        else:
+            continue
+        if any(w in NEGATORS for w in words[max(0, i - 2): i]):
+            polarity = -polarity
+        if polarity > 0:
+            pos += 1
+        else:
+            neg += 1
+    pos += sum(1 for ch in text if ch in POSITIVE_EMOJI)
+    neg += sum(1 for ch in text if ch in NEGATIVE_EMOJI)
+
+    if not pos and not neg:
+        # No sentiment words: usually small talk ("ok", "hmm"); long messages are less certain.
+        return "Neutral", 0.8 if len(words) <= 6 else 0.5
+    label = "Positive" if pos > neg else "Negative" if neg > pos else "Neutral"
+    return label, abs(pos - neg) / (pos + neg)
+
+
+# ------------------ Classifier ------------------ #
+class EmotionClassifier:
+    def __init__(self, threshold: float = EMOTION_LLM_THRESHOLD, cache_size: int = EMOTION_CACHE_SIZE):
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self.hits = 0
+        self.local = 0
+        self.llm_calls = 0
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: str, label: str):
+        with self._lock:
+            self._cache[key] = label
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    async def classify(self, text: str, ask_llm: Optional[Callable[[str], Awaitable[str]]] = None) -> str:
+        """
+        Cached verdict, else the lexicon verdict, else (low confidence) the LLM's.
+        `ask_llm` receives EMOTION_PROMPT filled in and returns the raw completion.
+        """
+        key = normalize_message(text)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+
+        label, confidence = score(text)
+        if confidence < self.threshold and ask_llm is not None:
+            try:
+                self.llm_calls += 1
+                verdict = (await ask_llm(EMOTION_PROMPT.format(message=text))).strip().capitalize()
+                if verdict in LABELS:
+                    label = verdict
+            except Exception as e:
+                log.warning(f"⚠️ Emotion detection error: {e}")
+                return label  # not cached: the LLM may answer next time
+        else:
+            self.local += 1
+        self._remember(key, label)
+        return label
+
+    def stats(self) -> dict:
+        total = self.hits + self.local + self.llm_calls
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "local": self.local,
+            "llm_calls": self.llm_calls,
+            "llm_rate": round(self.llm_calls / total, 4) if total else 0.0,
+        }
+
+
+# ------------------ Reference Labels ------------------ #
+# Hand-labelled chatty messages of the kind that reach detect_emotion, labelled the way
+# EMOTION_PROMPT asks. `python emotion.py --live` re-labels them with the model itself.
+SAMPLES = [
+    ("thank you so much", "Positive"),
+    ("thanks!", "Positive"),
+    ("you are awesome", "Positive"),
+    ("great job bot", "Positive"),
+    ("haha that's funny", "Positive"),
+    ("love this chatbot 😍", "Positive"),
+    ("very helpful, appreciate it", "Positive"),
+    ("nice", "Positive"),
+    ("wow super", "Positive"),
+    ("you're a genius 😂", "Positive"),
+    ("this is useless", "Negative"),
+    ("worst bot ever", "Negative"),
+    ("that's wrong", "Negative"),
+    ("not helpful at all", "Negative"),
+    ("I am very disappointed", "Negative"),
+    ("stupid answer", "Negative"),
+    ("you are so slow 😡", "Negative"),
+    ("this is not good", "Negative"),
+    ("I hate this", "Negative"),
+    ("rubbish reply 👎", "Negative"),
+    ("ok", "Neutral"),
+    ("hmm", "Neutral"),
+    ("I see", "Neutral"),
+    ("tell me more", "Neutral"),
+    ("okay got it", "Neutral"),
+    ("can you repeat that", "Neutral"),
+    ("bye for now then", "Neutral"),
+    ("let me think", "Neutral"),
+    ("good but slow", "Neutral"),
+    ("not bad", "Positive"),
+]
+
+
+# ------------------ CLI Evaluation ------------------ #
+if __name__ == "__main__":
+    import sys
+    import time
+    import asyncio
+
+    samples = SAMPLES
+    if "--live" in sys.argv:
+        from openai import OpenAI
+
+        client = OpenAI()
+        model = os.getenv("OPENAI_EMOTION_MODEL", "gpt-4o-mini")
+
+        def llm_label(message: str) -> str:
+            resp = client.chat.completions.create(
+                model=model, temperature=0.0, max_tokens=32,
+                messages=[{"role": "user", "content": EMOTION_PROMPT.format(message=message)}],
+            )
+            return (resp.choices[0].message.content or "").strip().capitalize()
+
+        samples = [(m, llm_label(m)) for m, _ in SAMPLES]
+
+    reference = dict(samples)
+    classifier = EmotionClassifier()
+
+    async def oracle(prompt: str) -> str:
+        # Stands in for the LLM: answers with the reference label for the message in the prompt.
+        return reference[prompt.rsplit("Message: ", 1)[1].strip()]
+
+    async def run():
+        local_agree = sum(1 for m, want in samples if score(m)[0] == want)
+        routed = [m for m, _ in samples if score(m)[1] < classifier.threshold]
+        agree = [await classifier.classify(m, oracle) == want for m, want in samples]
+        print(f"lexicon alone agrees with LLM labels: {local_agree}/{len(samples)} ({local_agree / len(samples):.0%})")
+        print(f"with LLM fallback below {classifier.threshold}: {sum(agree)}/{len(samples)}, "
+              f"{len(routed)} of {len(samples)} sent to the LLM: {routed}")
+        for (m, want), ok in zip(samples, agree):
+            if not ok:
+                print(f"    disagree: {m!r} lexicon={score(m)} llm={want}")
+
+    asyncio.run(run())
+
+    runs = 5000
+    start = time.perf_counter()
+    for _ in range(runs):
+        for m, _ in samples:
+            score(m)
+    print(f"score(): {(time.perf_counter() - start) * 1e6 / (runs * len(samples)):.1f} µs/message")
@@ -0,0 +1,136 @@
+"""
+Verified FAQ answers from answer_cache.json, served without an LLM call.
+
+Lookup is an exact match on a normalised question key first, then cosine
+similarity against precomputed embeddings of the FAQ questions. Only entries
+marked "verified" are ever returned.
+"""
+import os
+import re
+import json
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+log = logging.getLogger("msss")
+
+# ------------------ CONFIG ------------------ #
+FAQ_FILE = "answer_cache.json"
+FAQ_THRESHOLD = float(os.getenv("FAQ_SIMILARITY_THRESHOLD", "0.92"))
+
+_PUNCT = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """'  Who is the Principal?? ' -> 'who is the principal'"""
+    return _SPACES.sub(" ", _PUNCT.sub(" ", question.lower())).strip()
+
+
+# ------------------ Engine ------------------ #
+class FAQEngine:
+    def __init__(self, path: str = FAQ_FILE, threshold: float = FAQ_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries: Dict[str, dict] = {}
+        self._keys: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+                for question, item in raw.items():
+                    entries[normalize_question(question)] = {
+                        "question": question,
+                        "answer": item.get("answer", ""),
+                        "verified": bool(item.get("verified", False)),
+                    }
+            except Exception as e:
+                log.warning(f"⚠️ Failed to load FAQ file {self.path}: {e}")
+        with self._lock:
+            self._entries = entries
+            self._keys, self._matrix = [], None
+        log.info(f"📚 FAQ loaded: {len(entries)} entries")
+
+    def save(self):
+        with self._lock:
+            raw = {e["question"]: {"answer": e["answer"], "verified": e["verified"]} for e in self._entries.values()}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(raw, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def build_vectors(self, embed_many: Callable[[List[str]], Sequence[Sequence[float]]]):
+        """Embed the verified questions (cheap when the embedding cache is warm)."""
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if e["verified"]]
+            questions = [self._entries[k]["question"] for k in keys]
+        if not keys:
+            matrix = None
+        else:
+            matrix = np.asarray(embed_many(questions), dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1, norms)
+        with self._lock:
+            self._keys, self._matrix = keys, matrix
+
+    # ---- lookups ----
+    def lookup_exact(self, question: str) -> Optional[str]:
+        entry = self._entries.get(normalize_question(question))
+        if entry and entry["verified"]:
+            self.hits += 1
+            return entry["answer"]
+        return None
+
+    def lookup_semantic(self, embedding: Optional[Sequence[float]]) -> Optional[str]:
+        keys, matrix = self._keys, self._matrix
+        if embedding is None or matrix is None:
+            self.misses += 1
+            return None
+        q = np.asarray(embedding, dtype=np.float32)
+        if q.shape != (matrix.shape[1],):
+            self.misses += 1
+            return None
+        norm = float(np.linalg.norm(q))
+        scores = matrix @ (q / norm if norm else q)
+        best = int(np.argmax(scores))
+        entry = self._entries.get(keys[best])
+        if scores[best] >= self.threshold and entry and entry["verified"]:
+            self.hits += 1
+            self.semantic_hits += 1
+            return entry["answer"]
+        self.misses += 1
+        return None
+
+    # ---- admin ----
+    def upsert(self, question: str, answer: str, verified: bool = True):
+        with self._lock:
+            self._entries[normalize_question(question)] = {"question": question, "answer": answer, "verified": verified}
+
+    def invalidate(self, question: str) -> bool:
+        with self._lock:
+            return self._entries.pop(normalize_question(question), None) is not None
+
+    def entries(self) -> List[dict]:
+        with self._lock:
+            return [dict(e) for e in self._entries.values()]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "vectors": len(self._keys),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
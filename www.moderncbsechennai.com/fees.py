@@ -0,0 +1,337 @@
+"""
+Fee questions answered from a parsed table instead of FAISS + the LLM.
+
+Fee-structure text files in data/ are parsed into FeeItem rows
+(class × component × term → amount). Two layouts are understood:
+
+    LKG                                  Class | Annual Fee | Tuition Fee | Term-1 Total
+    Annual Fee: ₹700                     LKG   | 700        | 4500        | 10050
+    Tuition Fee (Term 1): ₹4,500         UKG   | 700        | 4800        | 10350
+    TERM-1 TOTAL: ₹10050
+
+(the table may also be transposed, with classes across the header). Files are
+re-parsed only when their mtime/size changes. FeeEngine.answer() builds a
+deterministic reply for "total fee for LKG", "term 2 fee for 11th bio",
+"fee structure for class 5" and returns None when the table can't answer, so
+the caller falls back to retrieval. Any word the table doesn't explain ("bus
+fee", "refund", "last date to pay") also means None: the full structure is
+only returned when the question asks for nothing but a class's fees.
+"""
+import os
+import re
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from intent_router import route_query, strip_classes
+
+log = logging.getLogger("msss")
+
+# ------------------ CONFIG ------------------ #
+FEE_FILE_HINT = re.compile(r"fee", re.I)
+
+_AMOUNT = re.compile(r"(?:₹|rs\.?|inr)?\s*(\d[\d,]*(?:\.\d+)?)\s*(?:/-)?\s*$", re.I)
+_TERM = re.compile(r"\b(?:term\s*[-–]?\s*(iii|ii|i|[1-3])|(1st|2nd|3rd|first|second|third)\s+term)\b", re.I)
+_TERM_WORDS = {"i": 1, "ii": 2, "iii": 3, "1": 1, "2": 2, "3": 3,
+               "1st": 1, "2nd": 2, "3rd": 3, "first": 1, "second": 2, "third": 3}
+_TOTAL = re.compile(r"\b(grand\s+total|total|overall)\b", re.I)
+_FEE_WORDS = re.compile(r"\b(fees?|charges?|amount|deposit)\b", re.I)
+_CELL_SPLIT = re.compile(r"\s*\|\s*|\t+|\s{2,}")
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_SPACES = re.compile(r"\s+")
+_FEE_LINE = re.compile(r"fee.*\d|\d.*fee", re.I)
+# Words a plain fee question may contain beyond classes, terms, totals and table components.
+_FILLER = frozenset("""
+    a an the is are what whats s how much tell me us about show give list please can could you do does
+    i we my our for of in to and per this year academic school class std standard grade
+    fee fees charge charges amount structure details detail breakdown full complete entire
+""".split())
+
+
+class FeeItem(NamedTuple):
+    class_name: str       # CLASS_MAP value: "LKG", "V", "XI-BIO"
+    component: str        # normalised key: "tuition", "annual", "total"
+    term: Optional[int]   # 1..3, or None for annual / whole-year rows
+    amount: float
+    label: str            # display label without the term part: "Tuition Fee"
+    source: str
+
+
+# ------------------ Parsing ------------------ #
+def _term(text: str) -> Optional[int]:
+    m = _TERM.search(text)
+    if not m:
+        return None
+    return _TERM_WORDS[(m.group(1) or m.group(2)).lower()]
+
+
+def _component(label: str) -> Tuple[str, str]:
+    """'TERM-1 TOTAL' -> ('total', 'Total'); 'Book Fees' -> ('book', 'Book Fees')"""
+    display = _SPACES.sub(" ", _TERM.sub(" ", label)).strip(" :-–()")
+    if _TOTAL.search(display):
+        return "total", "Grand Total" if re.search(r"grand", display, re.I) else "Total"
+    key = _FEE_WORDS.sub(" ", display.lower())
+    key = _SPACES.sub(" ", _NON_WORD.sub(" ", key)).strip()
+    return key or "fee", display or "Fee"
+
+
+def _amount(text: str) -> Optional[float]:
+    m = _AMOUNT.search(text.strip())
+    if not m:
+        return None
+    try:
+        return float(m.group(1).replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _classes(text: str) -> Tuple[str, ...]:
+    return route_query(text).classes
+
+
+def _item(cls: str, label: str, amount: float, source: str, term: Optional[int] = None) -> FeeItem:
+    key, display = _component(label)
+    return FeeItem(cls, key, term if term is not None else _term(label), amount, display, source)
+
+
+def parse_fee_text(text: str, source: str = "") -> List[FeeItem]:
+    items: List[FeeItem] = []
+    current: Tuple[str, ...] = ()
+    header: Optional[List[str]] = None
+    transposed = False
+
+    for raw in text.splitlines():
+        line = raw.strip().strip("•*-").strip()
+        if not line:
+            header = None
+            continue
+        cells = [c for c in _CELL_SPLIT.split(line) if c]
+
+        # ---- table rows ----
+        if len(cells) >= 3 and all(_amount(c) is None for c in cells):
+            class_cols = [_classes(c) for c in cells[1:]]
+            if all(class_cols):
+                header, transposed = cells, True
+                continue
+            if any(_TOTAL.search(c) or _FEE_WORDS.search(c) or _TERM.search(c) for c in cells):
+                header, transposed = cells, False
+                continue
+        if header and len(cells) == len(header):
+            amounts = [_amount(c) for c in cells[1:]]
+            if transposed and all(a is not None for a in amounts):
+                for col, amount in zip(header[1:], amounts):
+                    for cls in _classes(col):
+                        items.append(_item(cls, cells[0], amount, source))
+                continue
+            row_classes = _classes(cells[0])
+            if not transposed and row_classes:
+                for col, amount in zip(header[1:], amounts):
+                    if amount is not None:
+                        items.extend(_item(cls, col, amount, source) for cls in row_classes)
+                continue
+
+        # ---- class headings ("LKG", "Class 5", "Grade 10:") ----
+        # Checked before amounts, or the "5" of "Class 5" is read as ₹5 filed under the previous class.
+        if (heading := _classes(line)) and not _NON_WORD.sub(" ", strip_classes(line)).strip():
+            current = heading
+            continue
+
+        # ---- "Label: amount" lines under a class heading ----
+        amount = _amount(line)
+        label = _AMOUNT.sub("", line).strip(" :-–=")
+        line_classes = _classes(label) if label else ()
+        if amount is None or not label:
+            if line_classes:
+                current = line_classes
+            continue
+        if line_classes and not (_FEE_WORDS.search(label) or _TOTAL.search(label) or _TERM.search(label)):
+            continue  # e.g. "Class 5 strength: 40"
+        for cls in line_classes or current:
+            for known in (line_classes or ()):
+                label = re.sub(re.escape(known), "", label, flags=re.I)
+            items.append(_item(cls, label.strip(" :-–"), amount, source))
+    return items
+
+
+# ------------------ Engine ------------------ #
+def _rupees(amount: float) -> str:
+    text = f"{amount:,.2f}".rstrip("0").rstrip(".")
+    return f"₹{text}"
+
+
+def _term_name(term: Optional[int]) -> str:
+    return f" (Term {term})" if term else ""
+
+
+class FeeEngine:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._files: Dict[str, Tuple[Tuple[int, int], List[FeeItem]]] = {}
+        self._table: Dict[str, List[FeeItem]] = {}
+        self._lock = threading.Lock()
+
+    # ---- building ----
+    def refresh(self, data_dir: str = "data") -> bool:
+        """Re-parse fee files whose mtime/size changed. Returns True if the table changed."""
+        seen = set()
+        changed = False
+        files = dict(self._files)
+        for name in sorted(os.listdir(data_dir)) if os.path.isdir(data_dir) else []:
+            if not name.endswith(".txt"):
+                continue
+            path = os.path.join(data_dir, name)
+            st = os.stat(path)
+            stamp = (st.st_mtime_ns, st.st_size)
+            seen.add(name)
+            if name in files and files[name][0] == stamp:
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            fee_like = FEE_FILE_HINT.search(name) or len(_FEE_LINE.findall(text)) >= 3
+            files[name] = (stamp, parse_fee_text(text, name) if fee_like else [])
+            changed = True
+        for name in set(files) - seen:
+            del files[name]
+            changed = True
+        if changed:
+            table: Dict[str, List[FeeItem]] = {}
+            for _, items in files.values():
+                for item in items:
+                    table.setdefault(item.class_name, []).append(item)
+            with self._lock:
+                self._files, self._table = files, table
+            log.info(f"💰 Fee table: {sum(len(v) for v in table.values())} rows for {len(table)} classes")
+        return changed
+
+    # ---- answering ----
+    def answer(self, question: str, classes: Optional[Sequence[str]] = None) -> Optional[str]:
+        classes = classes if classes is not None else _classes(question)
+        table = self._table
+        known = [c for c in classes if c in table]
+        if not known:
+            self.misses += 1
+            return None
+        term = _term(question)
+        q = question.lower()
+        wants_total = bool(_TOTAL.search(q))
+        parts = []
+        for cls in known:
+            part = self._answer_class(cls, table[cls], q, term, wants_total)
+            if part is None:
+                self.misses += 1
+                return None
+            parts.append(part)
+        self.hits += 1
+        return "\n\n".join(parts)
+
+    @staticmethod
+    def _unexplained(q: str, components) -> List[str]:
+        """Words of `q` that are not a class, term, total, table component or filler."""
+        q = _TOTAL.sub(" ", _TERM.sub(" ", strip_classes(q)))
+        for c in sorted(components, key=len, reverse=True):
+            q = re.sub(rf"\b{re.escape(c)}\b", " ", q)
+        return [w for w in _NON_WORD.sub(" ", q).split() if w not in _FILLER and not w.isdigit()]
+
+    @staticmethod
+    def _answer_class(cls: str, items: List[FeeItem], q: str, term: Optional[int], wants_total: bool) -> Optional[str]:
+        components = {i.component for i in items if i.component != "total"}
+        if FeeEngine._unexplained(q, components):
+            return None  # e.g. "bus fee", "refund", "late fee": something the table doesn't hold
+        asked = [c for c in components if re.search(rf"\b{re.escape(c)}\b", q)]
+
+        if asked:
+            rows = [i for i in items if i.component in asked and (term is None or i.term in (term, None))]
+            if not rows:
+                return None
+            return "\n".join(f"**{cls} — {i.label}{_term_name(i.term)}**: {_rupees(i.amount)}" for i in rows)
+
+        if wants_total or term is not None:
+            totals = [i for i in items if i.component == "total" and i.term == term]
+            if totals:
+                label = f"Term {term} Total" if term else totals[0].label
+                return f"**{cls} — {label}**: {_rupees(totals[0].amount)}"
+            if term is not None:
+                rows = [i for i in items if i.term == term and i.component != "total"]
+                if not rows:
+                    return None
+                body = "\n".join(f"• {i.label}: {_rupees(i.amount)}" for i in rows)
+                return f"**{cls} — Term {term} Fees** 💰\n\n{body}\n\n• **Total: {_rupees(sum(i.amount for i in rows))}**"
+            return None  # no explicit grand total; don't guess which rows add up
+
+        if not _FEE_WORDS.search(q):
+            return None
+        lines = [f"• {i.label}{_term_name(i.term)}: {_rupees(i.amount)}" for i in items if i.component != "total"]
+        lines += [f"• **{f'Term {i.term} Total' if i.term else i.label}: {_rupees(i.amount)}**"
+                  for i in items if i.component == "total"]
+        return f"**{cls} Fee Structure** 💰\n\n" + "\n\n".join(lines) + "\n\n🟡 Want the fees for another class?"
+
+    def stats(self) -> dict:
+        return {
+            "files": sum(1 for _, items in self._files.values() if items),
+            "classes": len(self._table),
+            "rows": sum(len(v) for v in self._table.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    import sys
+    import time
+    import tempfile
+
+    sample = """Fee Structure 2025-26
+
+LKG
+Annual Fee: ₹700
+Tuition Fee: ₹4,500
+Book Fees: ₹1850
+Amenity Fee: ₹3000
+TERM-1 TOTAL: ₹10050
+TERM-2 TOTAL: ₹7500
+TERM-3 TOTAL: ₹7500
+GRAND TOTAL: ₹25050
+
+Class | Annual Fee | Tuition Fee | Term-1 Total | Term-2 Total | Term-3 Total | Grand Total
+11th bio | 1000 | 9000 | 15000 | 9000 | 9000 | 33000
+11th cs | 1000 | 9500 | 15500 | 9500 | 9500 | 34500
+
+Class 1
+Annual Fee: ₹800
+Tuition Fee: ₹5,000
+TERM-1 TOTAL: ₹8,800
+
+Grade 10
+Annual Fee: ₹1,200
+Tuition Fee: ₹7,500
+Class 10 strength: 40
+TERM-1 TOTAL: ₹12,700
+"""
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else tempfile.mkdtemp()
+    if len(sys.argv) == 1:
+        with open(os.path.join(data_dir, "fees.txt"), "w", encoding="utf-8") as f:
+            f.write(sample)
+
+    engine = FeeEngine()
+    start = time.perf_counter()
+    engine.refresh(data_dir)
+    print(f"parsed in {(time.perf_counter() - start) * 1000:.2f} ms: {engine.stats()}")
+    start = time.perf_counter()
+    engine.refresh(data_dir)
+    print(f"unchanged refresh: {(time.perf_counter() - start) * 1000:.3f} ms")
+
+    questions = ["total fee for LKG", "term 2 fee for 11th bio", "fee structure for LKG", "fees for class 1",
+                 "tuition fee for grade 10",
+                 "tuition fee for 11th cs", "what is the fee for class 9", "is there a bus fee for LKG?",
+                 "last date to pay fees for LKG"]
+    for q in questions:
+        print(f"\nQ: {q}\n{engine.answer(q)}")
+
+    runs = 2000
+    start = time.perf_counter()
+    for _ in range(runs):
+        for q in questions:
+            engine.answer(q)
+    print(f"\nanswer(): {(time.perf_counter() - start) * 1e6 / (runs * len(questions)):.1f} µs/question")
@@ -0,0 +1,459 @@
+"""
+Outbound-call governor for OpenAI requests.
+
+One Governor per model:
+    - bounds concurrent calls, async and threaded alike (one shared count); a
+      caller waits for a slot at most until its deadline, and at most
+      OPENAI_MAX_QUEUE callers may wait at all,
+    - gives every attempt a timeout: the per-call timeout, capped by what is
+      left of the request deadline (see `deadline()`),
+    - retries transient failures (timeouts, connection errors, 408/409/429/5xx)
+      with full-jitter backoff, while the retry budget allows: retries are
+      capped at RETRY_BUDGET_RATIO of calls so a failing upstream is not
+      hit with a retry storm,
+    - opens a circuit breaker after BREAKER_FAILURES consecutive failures; for
+      BREAKER_COOLDOWN_S every call fails fast with Unavailable, then one probe
+      call decides whether to close it again.
+
+Callers catch Unavailable (or any error) and fall back to local answers.
+"""
+import os
+import time
+import random
+import asyncio
+import inspect
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+log = logging.getLogger("msss")
+
+T = TypeVar("T")
+
+# ------------------ CONFIG ------------------ #
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))   # per model, per worker
+OPENAI_MAX_QUEUE = int(os.getenv("OPENAI_MAX_QUEUE", "64"))
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "20"))
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "3"))
+RETRY_BUDGET_RATIO = float(os.getenv("OPENAI_RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MAX = 10.0
+BACKOFF_BASE_S = 0.2
+BACKOFF_MAX_S = 2.0
+BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_S = float(os.getenv("OPENAI_BREAKER_COOLDOWN_S", "15"))
+MIN_ATTEMPT_S = 0.25  # not worth starting an attempt with less time than this left
+
+_TRANSIENT_STATUS = {408, 409, 429}
+
+
+class Unavailable(Exception):
+    """Raised instead of calling upstream: breaker open, queue full or no time left."""
+
+
+# ------------------ Deadlines ------------------ #
+_deadline: ContextVar[Optional[float]] = ContextVar("openai_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Calls made inside (including tasks created inside) finish within `seconds` from now."""
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def is_transient(e: BaseException) -> bool:
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status in _TRANSIENT_STATUS or status >= 500
+    name = type(e).__name__
+    return "Timeout" in name or "Connection" in name  # openai.APITimeoutError / APIConnectionError
+
+
+# ------------------ Slots ------------------ #
+class _Waiter:
+    __slots__ = ("granted", "wake")
+
+    def __init__(self, wake: Callable[[], None]):
+        self.granted = False
+        self.wake = wake
+
+
+class Slots:
+    """
+    A concurrency limit shared by event-loop tasks and threads. A released slot
+    is handed straight to the oldest waiter (FIFO), whichever kind it is.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._waiters: "deque[_Waiter]" = deque()
+        self._lock = threading.Lock()
+
+    def _try_take(self, waiter: _Waiter) -> bool:
+        with self._lock:
+            if self.in_use < self.limit and not self._waiters:
+                self.in_use += 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def _give_up(self, waiter: _Waiter) -> bool:
+        """Stop waiting; True if the slot was handed over in the meantime (the caller now holds it)."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def acquire_sync(self, timeout: Optional[float] = None) -> bool:
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        if self._try_take(waiter):
+            return True
+        return event.wait(timeout) or self._give_up(waiter)
+
+    async def acquire(self, timeout: Optional[float] = None) -> bool:
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+
+        waiter = _Waiter(wake)
+        if self._try_take(waiter):
+            return True
+        try:
+            await asyncio.wait_for(woken, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self._give_up(waiter)
+        except BaseException:
+            if self._give_up(waiter):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.in_use -= 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+        try:
+            waiter.wake()
+        except RuntimeError:  # its event loop is gone; pass the slot on
+            self.release()
+
+
+async def _close(stream):
+    """Close an upstream stream (openai.AsyncStream.close, async generators' aclose)."""
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        log.debug(f"closing stream failed: {e}")
+
+
+# ------------------ Circuit Breaker ------------------ #
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown_s: float = BREAKER_COOLDOWN_S):
+        self.failures = failures
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self.trips = 0
+        self._count = 0
+        self._opened = 0.0
+        self._probe_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == "open" and now - self._opened >= self.cooldown_s:
+                self.state, self._probe_at = "half_open", None
+            if self.state == "closed":
+                return True
+            # One probe at a time; a probe that never reported back (cancelled, timed out in the queue) expires.
+            if self.state == "half_open" and (self._probe_at is None or now - self._probe_at >= self.cooldown_s):
+                self._probe_at = now
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state, self._count, self._probe_at = "closed", 0, None
+
+    def failure(self):
+        with self._lock:
+            self._count += 1
+            if self.state == "half_open" or (self.state == "closed" and self._count >= self.failures):
+                self.state, self._opened, self._probe_at = "open", time.monotonic(), None
+                self.trips += 1
+
+
+# ------------------ Governor ------------------ #
+class Governor:
+    def __init__(self, name: str, concurrency: int = OPENAI_MAX_CONCURRENCY, max_queue: int = OPENAI_MAX_QUEUE,
+                 timeout_s: float = OPENAI_TIMEOUT_S, max_attempts: int = OPENAI_MAX_ATTEMPTS):
+        self.name = name
+        self.timeout_s = timeout_s
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.breaker = CircuitBreaker()
+        self.calls = self.retries = self.failures = self.rejected = 0
+        self._budget = RETRY_BUDGET_MAX
+        self._waiting = 0
+        self._slots = Slots(concurrency)
+        self._lock = threading.Lock()
+
+    # ---- admission ----
+    def _admit(self):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise Unavailable(f"{self.name}: circuit open")
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                raise Unavailable(f"{self.name}: {self._waiting} calls already queued")
+            self._waiting += 1
+            self.calls += 1
+            self._budget = min(RETRY_BUDGET_MAX, self._budget + RETRY_BUDGET_RATIO)
+
+    def _admitted(self):
+        with self._lock:
+            self._waiting -= 1
+
+    def _no_slot(self):
+        self.rejected += 1
+        return Unavailable(f"{self.name}: no free slot before the deadline")
+
+    async def _acquire(self):
+        self._admit()
+        try:
+            left = remaining()
+            if not await self._slots.acquire(max(0.0, left) if left is not None else None):
+                raise self._no_slot()
+        finally:
+            self._admitted()
+
+    def _acquire_sync(self):
+        self._admit()
+        try:
+            left = remaining()
+            if not self._slots.acquire_sync(max(0.0, left) if left is not None else None):
+                raise self._no_slot()
+        finally:
+            self._admitted()
+
+    # ---- attempts ----
+    def _attempt_timeout(self, timeout_s: Optional[float]) -> float:
+        timeout = timeout_s or self.timeout_s
+        left = remaining()
+        if left is not None:
+            if left < MIN_ATTEMPT_S:
+                raise Unavailable(f"{self.name}: request deadline reached")
+            timeout = min(timeout, left)
+        return timeout
+
+    def _retry_delay(self, e: BaseException, attempt: int) -> Optional[float]:
+        """Backoff before the next attempt, or None when the failure is final."""
+        if not is_transient(e) or attempt + 1 >= self.max_attempts:
+            return None
+        delay = random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+        left = remaining()
+        if left is not None and left - delay < MIN_ATTEMPT_S:
+            return None
+        with self._lock:
+            if self._budget < 1:
+                return None
+            self._budget -= 1
+        self.retries += 1
+        return delay
+
+    def _failed(self, e: BaseException):
+        if is_transient(e):
+            self.failures += 1
+            self.breaker.failure()
+            log.warning(f"⚠️ {self.name} call failed ({type(e).__name__}: {e}); breaker {self.breaker.state}")
+        else:
+            self.breaker.success()  # upstream answered; the request itself was bad
+
+    async def _attempts(self, fn: Callable[[float], Awaitable[T]], timeout_s: Optional[float]) -> T:
+        attempt = 0
+        while True:
+            timeout = self._attempt_timeout(timeout_s)
+            try:
+                result = await asyncio.wait_for(fn(timeout), timeout)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self._failed(e)
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.success()
+            return result
+
+    # ---- public ----
+    async def call(self, fn: Callable[[float], Awaitable[T]], timeout_s: Optional[float] = None) -> T:
+        """`fn(timeout)` makes one upstream request; pass `timeout` on to the client too."""
+        await self._acquire()
+        try:
+            return await self._attempts(fn, timeout_s)
+        finally:
+            self._slots.release()
+
+    def call_sync(self, fn: Callable[[float], T], timeout_s: Optional[float] = None) -> T:
+        """Blocking twin of call() for the sync client; `fn` must honour `timeout` itself."""
+        self._acquire_sync()
+        try:
+            attempt = 0
+            while True:
+                timeout = self._attempt_timeout(timeout_s)
+                try:
+                    result = fn(timeout)
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        self._failed(e)
+                        raise
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                self.breaker.success()
+                return result
+        finally:
+            self._slots.release()
+
+    async def stream(self, fn: Callable[[float], Awaitable[AsyncIterator[T]]],
+                     timeout_s: Optional[float] = None) -> AsyncIterator[T]:
+        """
+        Like call() for streaming responses: opening the stream is retried, and the
+        slot is held until the stream ends, and the upstream stream is closed
+        however it ends. Each chunk must arrive within the attempt timeout.
+        """
+        await self._acquire()
+        upstream = None
+        try:
+            upstream = await self._attempts(fn, timeout_s)
+            chunks = upstream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self._attempt_timeout(timeout_s))
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    self._failed(e)
+                    raise
+                yield chunk
+        finally:
+            if upstream is not None:
+                await _close(upstream)
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "breaker": self.breaker.state,
+            "trips": self.breaker.trips,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "in_flight": self._slots.in_use,
+            "queued": self._waiting,
+            "retry_budget": round(self._budget, 2),
+        }
+
+
+_GOVERNORS: Dict[str, Governor] = {}
+_GOVERNORS_LOCK = threading.Lock()
+
+
+def governor(model: str) -> Governor:
+    """The shared governor for `model`."""
+    with _GOVERNORS_LOCK:
+        if model not in _GOVERNORS:
+            _GOVERNORS[model] = Governor(model)
+        return _GOVERNORS[model]
+
+
+def governor_stats() -> dict:
+    return {name: g.stats() for name, g in list(_GOVERNORS.items())}
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    # Simulated slow upstream: 0.2 s normally, but 40% of calls hang for HANG_S and 10% fail with a 503.
+    N, SPREAD_S, HANG_S, DEADLINE_S, TIMEOUT_S = 200, 2.0, 5.0, 3.0, 1.0
+
+    class ServerError(Exception):
+        status_code = 503
+
+    async def upstream(rng: random.Random):
+        r = rng.random()
+        if r < 0.4:
+            await asyncio.sleep(HANG_S)
+        elif r < 0.5:
+            await asyncio.sleep(0.05)
+            raise ServerError("503 Service Unavailable")
+        else:
+            await asyncio.sleep(0.2)
+        return "ANSWER"
+
+    async def run(governed: bool):
+        rng = random.Random(0)
+        gov = Governor("bench", concurrency=16, timeout_s=TIMEOUT_S)
+        slots = asyncio.Semaphore(16)  # the previous setup: a bare semaphore, no timeout or retries
+        upstream_calls = 0
+        outcomes = {"llm": 0, "fallback": 0}
+
+        async def attempt(timeout):
+            nonlocal upstream_calls
+            upstream_calls += 1
+            return await upstream(rng)
+
+        async def request(i):
+            await asyncio.sleep(SPREAD_S * i / N)
+            start = time.perf_counter()
+            try:
+                if governed:
+                    with deadline(DEADLINE_S):
+                        await gov.call(attempt)
+                else:
+                    async with slots:
+                        await attempt(None)
+                outcomes["llm"] += 1
+            except Exception:
+                outcomes["fallback"] += 1  # api answers from FAQ / retrieved passages instead
+            return time.perf_counter() - start
+
+        lat = sorted(await asyncio.gather(*(request(i) for i in range(N))))
+        label = "governed" if governed else "ungoverned"
+        print(f"{label:10s}: p50 {lat[N // 2] * 1000:6.0f} ms, p99 {lat[int(N * 0.99)] * 1000:6.0f} ms, "
+              f"max {lat[-1] * 1000:6.0f} ms | {outcomes} | {upstream_calls} upstream calls"
+              + (f" | {gov.stats()}" if governed else ""))
+
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(run(False))
+    asyncio.run(run(True))
@@ -0,0 +1,253 @@
+"""
+Pickle-free on-disk vector index: a raw FAISS index opened with mmap plus an
+offset-indexed chunk file that is read lazily by row.
+
+    index.faiss   faiss.write_index(IndexFlatL2); row i is chunk i
+    chunks.bin    b"MSSCHNK1" | uint64 n | uint64 offsets[n + 1] | records
+                  record i = UTF-8 JSON {"id", "source", "hash", "text"}
+
+Opening costs two mmap calls regardless of corpus size; pages are faulted in
+on demand and shared between worker processes through the OS page cache.
+
+The index path is a symlink to a sibling directory. A new version (index,
+chunks and whatever the caller adds, e.g. the manifest) is written into a
+fresh directory from stage_dir() and published with one os.replace of the
+link (commit_dir), so readers and crashes only ever see a complete set. An
+open index keeps reading the old mapping until the caller swaps to the new one.
+"""
+import os
+import json
+import mmap
+import time
+import shutil
+import struct
+import tempfile
+from typing import Callable, List, Optional, Sequence
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+# ------------------ CONFIG ------------------ #
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.bin"
+_MAGIC = b"MSSCHNK1"
+_HEADER = len(_MAGIC) + 8
+_STALE_STAGE_S = 3600  # staged dirs older than this were left by a crashed writer
+
+
+def _mmap_flag() -> int:
+    # IO_FLAG_MMAP_IFC maps flat indexes (faiss >= 1.9); older builds only map IVF lists.
+    for name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        if hasattr(faiss, name):
+            return getattr(faiss, name)
+    return 0
+
+
+# ------------------ Directory Swap ------------------ #
+def _stage_prefix(path: str) -> str:
+    return os.path.basename(os.path.normpath(path)) + ".v"
+
+
+def stage_dir(path: str) -> str:
+    """A new empty directory next to `path` to write the next version into."""
+    parent = os.path.dirname(os.path.normpath(path)) or "."
+    os.makedirs(parent, exist_ok=True)
+    live = os.path.realpath(path)
+    prefix = _stage_prefix(path)
+    for name in os.listdir(parent):
+        old = os.path.join(parent, name)
+        if (not name.startswith(prefix) or os.path.realpath(old) == live
+                or time.time() - os.lstat(old).st_mtime < _STALE_STAGE_S):
+            continue
+        if os.path.islink(old):
+            os.remove(old)
+        else:
+            shutil.rmtree(old, ignore_errors=True)
+    staged = tempfile.mkdtemp(prefix=prefix, dir=parent)
+    os.chmod(staged, 0o755)  # mkdtemp's 0700 would hide it from other users (e.g. a separate builder)
+    return staged
+
+
+def commit_dir(staged: str, path: str):
+    """Point `path` at the fully written `staged` directory (one os.replace), then drop the old one."""
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    if os.path.isdir(path) and previous is None:
+        # a plain directory from before the symlink layout: move it aside once
+        previous = stage_dir(path)
+        os.rmdir(previous)
+        os.replace(path, previous)
+    link = staged + ".link"
+    os.symlink(os.path.basename(staged), link)
+    os.replace(link, path)
+    if previous and previous != os.path.realpath(staged):
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def remove_dir(path: str):
+    """Delete `path` and the directory it points at."""
+    if os.path.islink(path):
+        target = os.path.realpath(path)
+        os.remove(path)
+        shutil.rmtree(target, ignore_errors=True)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+
+
+# ------------------ Chunk Store ------------------ #
+class ChunkStore:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[: len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not a chunk store")
+        (n,) = struct.unpack_from("<Q", self._mm, len(_MAGIC))
+        self._offsets = np.frombuffer(self._mm, dtype="<u8", count=n + 1, offset=_HEADER)
+        self._base = _HEADER + 8 * (n + 1)
+        self._n = n
+
+    def __len__(self):
+        return self._n
+
+    def get(self, row: int) -> dict:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return json.loads(self._mm[self._base + start : self._base + end])
+
+    @staticmethod
+    def write(path: str, records: Sequence[dict]):
+        payloads = [json.dumps(r, ensure_ascii=False).encode("utf-8") for r in records]
+        offsets = np.zeros(len(payloads) + 1, dtype="<u8")
+        np.cumsum([len(p) for p in payloads], out=offsets[1:])
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_MAGIC)
+            f.write(struct.pack("<Q", len(payloads)))
+            f.write(offsets.tobytes())
+            for p in payloads:
+                f.write(p)
+        os.replace(tmp, path)
+
+
+# ------------------ Index ------------------ #
+class MmapIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self.index = faiss.read_index(os.path.join(path, INDEX_FILE), _mmap_flag())
+        self.chunks = ChunkStore(os.path.join(path, CHUNKS_FILE))
+        if self.index.ntotal != len(self.chunks):
+            raise ValueError(f"{path}: {self.index.ntotal} vectors but {len(self.chunks)} chunks")
+
+    def __len__(self):
+        return self.index.ntotal
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return all(os.path.exists(os.path.join(path, f)) for f in (INDEX_FILE, CHUNKS_FILE))
+
+    @staticmethod
+    def write(path: str, records: Sequence[dict], vectors: np.ndarray):
+        """
+        Write `records` (id/source/hash/text) and their row-aligned `vectors` into
+        `path`, normally a stage_dir() that the caller commit_dir()s once complete.
+        """
+        os.makedirs(path, exist_ok=True)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        tmp = os.path.join(path, INDEX_FILE + ".tmp")
+        faiss.write_index(index, tmp)
+        ChunkStore.write(os.path.join(path, CHUNKS_FILE), records)
+        os.replace(tmp, os.path.join(path, INDEX_FILE))
+
+    # ---- bulk access (index updates) ----
+    def ids(self) -> List[str]:
+        return [self.chunks.get(i)["id"] for i in range(len(self.chunks))]
+
+    def vectors(self) -> np.ndarray:
+        return self.index.reconstruct_n(0, self.index.ntotal)
+
+    # ---- search ----
+    def document(self, row: int) -> Document:
+        rec = self.chunks.get(row)
+        return Document(page_content=rec["text"], metadata={"source": rec["source"], "hash": rec["hash"]})
+
+    def search_rows(
+        self,
+        embedding: Sequence[float],
+        k: int = 3,
+        accept: Optional[Callable[[dict], bool]] = None,
+        fetch_k: int = 20,
+    ) -> List[int]:
+        """Rows of the nearest chunks by L2 distance; with `accept`, the best `k` of `fetch_k` candidates that pass it."""
+        if not self.index.ntotal or k <= 0:
+            return []
+        q = np.asarray([embedding], dtype=np.float32)
+        _, found = self.index.search(q, min(self.index.ntotal, k if accept is None else max(k, fetch_k)))
+        rows: List[int] = []
+        for row in found[0]:
+            if row < 0:
+                continue
+            if accept is not None and not accept(self.chunks.get(int(row))):
+                continue
+            rows.append(int(row))
+            if len(rows) == k:
+                break
+        return rows
+
+    def search(
+        self,
+        embedding: Sequence[float],
+        k: int = 3,
+        accept: Optional[Callable[[dict], bool]] = None,
+        fetch_k: int = 20,
+    ) -> List[Document]:
+        return [self.document(row) for row in self.search_rows(embedding, k, accept, fetch_k)]
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    import gc
+    import time
+    import shutil
+    import tempfile
+
+    from langchain_community.vectorstores import FAISS
+
+    def private_mb() -> float:
+        # resident minus file-backed pages: the heap a second worker could not share
+        with open("/proc/self/statm") as f:
+            _, resident, shared = (int(x) for x in f.read().split()[:3])
+        return (resident - shared) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+    dim = 1536
+    rng = np.random.default_rng(0)
+    root = tempfile.mkdtemp()
+    for n in [int(x) for x in os.getenv("BENCH_SIZES", "1000,10000,40000").split(",")]:
+        vectors = rng.standard_normal((n, dim)).astype(np.float32)
+        records = [{"id": f"f.txt:{i}", "source": "f.txt", "hash": str(i), "text": f"chunk {i} " * 120} for i in range(n)]
+        new_dir, old_dir = os.path.join(root, f"mmap{n}"), os.path.join(root, f"lc{n}")
+        MmapIndex.write(new_dir, records, vectors)
+        docs = [Document(page_content=r["text"], metadata={"source": r["source"]}) for r in records]
+        lc = FAISS.from_embeddings([(d.page_content, v) for d, v in zip(docs, vectors)], embedding=None,
+                                   metadatas=[d.metadata for d in docs])
+        lc.save_local(old_dir)
+        del lc, docs, records, vectors
+        gc.collect()
+
+        base = private_mb()
+        start = time.perf_counter()
+        lc = FAISS.load_local(old_dir, None, allow_dangerous_deserialization=True)
+        lc_s, lc_mb = time.perf_counter() - start, private_mb() - base
+        del lc
+        gc.collect()
+
+        base = private_mb()
+        start = time.perf_counter()
+        idx = MmapIndex(new_dir)
+        mm_s = time.perf_counter() - start
+        idx.search(rng.standard_normal(dim), k=3)
+        mm_mb = private_mb() - base
+        print(f"{n:6d} chunks | pickle load {lc_s * 1000:8.1f} ms +{lc_mb:7.1f} MiB private "
+              f"| mmap open {mm_s * 1000:6.2f} ms +{mm_mb:7.1f} MiB private after first search")
+        del idx
+    shutil.rmtree(root)
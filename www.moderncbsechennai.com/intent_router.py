@@ -0,0 +1,165 @@
+"""
+One-pass intent and class detection for /ask.
+
+Every phrase from GREETINGS, FAREWELLS, INTENT_MAP, FACTUAL_KEYWORDS and
+HELP_PHRASES is compiled into a single word-bounded alternation (longest
+phrase first), so a query is scanned once and "hi" no longer fires inside
+"this". Class mentions are resolved through CLASS_MAP plus "class 5" /
+"grade ix" forms. route_query() returns both; api.fast_path and later stages
+branch on it. A message is small talk when nothing is left after removing
+greeting / farewell / help phrases and filler words, so "hi there, what are
+the school timings?" is not answered with a canned greeting.
+"""
+import re
+from typing import Dict, FrozenSet, NamedTuple, Set, Tuple
+
+# ------------------ Vocabulary ------------------ #
+GREETINGS = ["hello", "hi", "hey", "good morning", "good afternoon", "good evening"]
+FAREWELLS = ["bye", "goodbye", "see you", "farewell"]
+
+INTENT_MAP = {
+    "fees": ["fee", "fees", "structure", "tuition"],
+    "staff": ["principal", "teacher", "staff"],
+    "address": ["address", "location", "contact"],
+    "self_identity": ["who are you", "your name", "what are you", "who created you"],
+}
+
+FACTUAL_KEYWORDS = ["what", "where", "when", "how", "who", "which", "fee", "fees", "address", "location",
+                    "principal", "teacher", "school", "exam", "contact", "number", "subject", "student", "class",
+                    "admission"]
+HELP_PHRASES = ["provide", "offer", "help", "assist", "what can you"]
+
+_CHATTER_INTENTS = frozenset({"greeting", "farewell", "help"})
+# Words that carry no request of their own next to a greeting, farewell or "what can you do".
+FILLER = frozenset("""
+    a am an and are be brightly can could dear do does everyone for friend friends guys how i im is it me
+    much my nice oh ok okay please so sir madam mam thank thanks the there to very we what will with would
+    you your again all lot
+""".split())
+
+CLASS_MAP = {
+    "lkg": "LKG", "ukg": "UKG", "1st": "I", "first": "I", "i": "I",
+    "2nd": "II", "second": "II", "3rd": "III", "third": "III",
+    "4th": "IV", "5th": "V", "6th": "VI", "7th": "VII", "8th": "VIII",
+    "9th": "IX", "10th": "X", "tenth": "X",
+    "11th cs": "XI-CS", "11th bio": "XI-BIO", "11th comm": "XI-COMM",
+    "12th cs": "XII-CS", "12th bio": "XII-BIO", "12th comm": "XII-COMM",
+}
+# Keys that are ordinary words on their own ("I want...", "first term"); only read after "class".
+_AMBIGUOUS_CLASS_KEYS = {"i", "first", "second", "third"}
+_ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X", "XI", "XII"]
+
+
+# ------------------ Compilation ------------------ #
+def _alternation(phrases) -> re.Pattern:
+    ordered = sorted(set(phrases), key=len, reverse=True)
+    body = "|".join(r"\s+".join(map(re.escape, p.split())) for p in ordered)
+    return re.compile(rf"(?<!\w)(?:{body})(?!\w)")
+
+
+def _build_phrase_intents() -> Dict[str, Set[str]]:
+    table: Dict[str, Set[str]] = {}
+    sources = [("greeting", GREETINGS), ("farewell", FAREWELLS), ("factual", FACTUAL_KEYWORDS),
+               ("help", HELP_PHRASES), *INTENT_MAP.items()]
+    for intent, phrases in sources:
+        for phrase in phrases:
+            table.setdefault(phrase, set()).add(intent)
+    # A longer match hides the phrases inside it ("what are you" ⊃ "what"), so it inherits their intents.
+    for phrase in table:
+        for other in table:
+            if other != phrase and re.search(rf"(?<!\w){re.escape(other)}(?!\w)", phrase):
+                table[phrase] |= table[other]
+    return table
+
+
+_PHRASE_INTENTS = _build_phrase_intents()
+_INTENTS = _alternation(_PHRASE_INTENTS)
+_CLASSES = _alternation(k for k in CLASS_MAP if k not in _AMBIGUOUS_CLASS_KEYS)
+_CLASS_CONTEXT = re.compile(
+    r"(?<!\w)(?:class|std|standard|grade)\s*[-.:]?\s*"
+    r"(1[0-2]|[1-9]|xii|xi|x|ix|viii|vii|vi|v|iv|iii|ii|i|first|second|third)(?!\w)"
+)
+_WORD_NUMBERS = {"first": 1, "second": 2, "third": 3}
+_SPACES = re.compile(r"\s+")
+_WORDS = re.compile(r"[a-z0-9]+")
+
+
+def _class_from_context(token: str) -> str:
+    if token.isdigit():
+        return _ROMAN[int(token) - 1]
+    if token in _WORD_NUMBERS:
+        return _ROMAN[_WORD_NUMBERS[token] - 1]
+    return token.upper()
+
+
+# ------------------ Routing ------------------ #
+class Route(NamedTuple):
+    intents: FrozenSet[str]
+    classes: Tuple[str, ...]
+    small_talk: bool  # nothing but greeting / farewell / help phrases and filler
+
+
+def route_query(text: str) -> Route:
+    q = text.lower()
+    intents: Set[str] = set()
+    rest = []
+    last = 0
+    for m in _INTENTS.finditer(q):
+        found = _PHRASE_INTENTS[_SPACES.sub(" ", m.group(0))]
+        intents |= found
+        if not found & _CHATTER_INTENTS:
+            rest.append(m.group(0))
+        rest.append(q[last:m.start()])
+        last = m.end()
+    rest.append(q[last:])
+    small_talk = all(w in FILLER for w in _WORDS.findall(" ".join(rest)))
+
+    classes = []
+    for m in _CLASSES.finditer(q):
+        classes.append((m.start(), CLASS_MAP[_SPACES.sub(" ", m.group(0))]))
+    for m in _CLASS_CONTEXT.finditer(q):
+        classes.append((m.start(1), _class_from_context(m.group(1))))
+    ordered = tuple(dict.fromkeys(c for _, c in sorted(classes)))
+    return Route(frozenset(intents), ordered, small_talk)
+
+
+def strip_classes(text: str) -> str:
+    """Lower-cased `text` with every class mention route_query() would detect blanked out."""
+    q = text.lower()
+    q = _CLASS_CONTEXT.sub(" ", q)
+    return _CLASSES.sub(" ", q)
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    import time
+
+    queries = [
+        "hi", "hello, what are the fees for 5th class?", "this is great", "good morning!",
+        "who are you", "what can you do", "ok bye", "fee structure for class 11th cs and ukg",
+        "where is the school located", "I want the 10th exam timetable", "grade 3 admission", "thanks a lot",
+        "hi there, what are the school timings?", "hey brightly, how are you?",
+    ]
+
+    def legacy(q: str):
+        ql = q.lower()
+        hits = [
+            any(g in ql for g in GREETINGS),
+            any(f in ql for f in FAREWELLS),
+            any(re.search(rf"\b{kw}\b", ql) for kw in FACTUAL_KEYWORDS),
+            *(any(p in ql for p in phrases) for phrases in INTENT_MAP.values()),
+            any(w in ql for w in HELP_PHRASES),
+        ]
+        return hits
+
+    for q in queries:
+        r = route_query(q)
+        print(f"{q!r:48s} intents={sorted(r.intents)} classes={list(r.classes)} small_talk={r.small_talk}")
+
+    runs = 2000
+    for name, fn in (("legacy substring chain", legacy), ("route_query", route_query)):
+        start = time.perf_counter()
+        for _ in range(runs):
+            for q in queries:
+                fn(q)
+        print(f"{name:24s}: {(time.perf_counter() - start) * 1e6 / (runs * len(queries)):6.1f} µs/query")
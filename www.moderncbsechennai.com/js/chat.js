@@ -327,10 +327,11 @@ window.addEventListener("DOMContentLoaded", () => {
           if (!newText || waiting) return;
           msg.text = newText; msg.time = getTime();
           chatHistory.splice(idx + 1);
-          chatHistory.push({ type: "bot", text: "", time: null, typing: true });
+          const botMsg = { type: "bot", text: "", time: null, typing: true };
+          chatHistory.push(botMsg);
           renderMessages(); waiting = true; sendBtn.disabled = true;
           try {
-            const answer = await postToAsk(newText);
+            const answer = await askServer(newText, showPartial(botMsg));
             chatHistory.pop();
             chatHistory.push({ type: "bot", text: answer, time: getTime() });
           } catch {
@@ -379,6 +380,59 @@ window.addEventListener("DOMContentLoaded", () => {
     return data.answer || "I couldn't find an answer.";
   }
 
+  // Streams /ask/stream (SSE over fetch); onPartial(text) fires as chunks arrive.
+  async function streamAsk(question, onPartial) {
+    const res = await fetch(`${API}/ask/stream`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json", "Accept": "text/event-stream" },
+      body: JSON.stringify({ question, session_id: sessionId }),
+    });
+    if (!res.ok || !res.body) throw new Error(`${res.status}`);
+    const reader  = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "", text = "", final = null;
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buffer.indexOf("\n\n")) !== -1) {
+        const line = buffer.slice(0, sep).split("\n").find(l => l.startsWith("data:"));
+        buffer = buffer.slice(sep + 2);
+        if (!line) continue;
+        const evt = JSON.parse(line.slice(5));
+        if (evt.type === "delta") { text += evt.text; onPartial(text); }
+        if (evt.type === "done")  {
+          final = evt.answer;
+          if (evt.session_id) { sessionId = evt.session_id; localStorage.setItem("chat_session", sessionId); }
+        }
+      }
+    }
+    return final || text || "I couldn't find an answer.";
+  }
+
+  // Prefer streaming; fall back to plain /ask only if nothing was streamed yet.
+  async function askServer(question, onPartial) {
+    let streamed = false;
+    try {
+      return await streamAsk(question, t => { streamed = true; onPartial(t); });
+    } catch (err) {
+      if (streamed) throw err;
+      return postToAsk(question);
+    }
+  }
+
+  let renderPending = false;
+  function scheduleRender() {
+    if (renderPending) return;
+    renderPending = true;
+    requestAnimationFrame(() => { renderPending = false; renderMessages(); });
+  }
+
+  function showPartial(botMsg) {
+    return (text) => { botMsg.typing = false; botMsg.text = text; scheduleRender(); };
+  }
+
   // ---- Send ---------------------------------------------------------------
   async function handleSend() {
     if (waiting) return;
@@ -394,11 +448,12 @@ window.addEventListener("DOMContentLoaded", () => {
     renderMessages();
     userInput.value = ""; autoResizeTextarea();
 
-    chatHistory.push({ type: "bot", text: "", time: null, typing: true });
+    const botMsg = { type: "bot", text: "", time: null, typing: true };
+    chatHistory.push(botMsg);
     renderMessages(); waiting = true; sendBtn.disabled = true;
 
     try {
-      const answer = await postToAsk(text);
+      const answer = await askServer(text, showPartial(botMsg));
       chatHistory.pop();
       chatHistory.push({ type: "bot", text: answer, time: getTime() });
 
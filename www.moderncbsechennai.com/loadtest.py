@@ -0,0 +1,53 @@
+"""
+Concurrent /ask load test.
+
+    python loadtest.py http://localhost:8080 --clients 50 --requests 200
+
+Prints throughput and latency percentiles so a change to the request path can
+be compared against a baseline run on the same upstream.
+"""
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+QUESTIONS = [
+    "What is the fee structure for 5th class?",
+    "Who is the principal?",
+    "What are the school timings?",
+    "Tell me about admissions for LKG and the bus facility",
+    "What facilities does the school have?",
+]
+
+
+def _one(base_url: str, i: int):
+    start = time.perf_counter()
+    res = requests.post(f"{base_url}/ask", json={"question": QUESTIONS[i % len(QUESTIONS)]}, timeout=120)
+    return time.perf_counter() - start, res.status_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("base_url")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        results = list(pool.map(lambda i: _one(args.base_url.rstrip("/"), i), range(args.requests)))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(t for t, _ in results)
+    errors = sum(1 for _, code in results if code != 200)
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    print(f"{args.requests} requests, {args.clients} clients, {errors} errors")
+    print(f"throughput: {args.requests / wall:.1f} req/s (wall {wall:.2f}s)")
+    print(f"latency: p50 {p(0.50) * 1000:.0f} ms, p95 {p(0.95) * 1000:.0f} ms, "
+          f"p99 {p(0.99) * 1000:.0f} ms, mean {statistics.mean(latencies) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Sympy answers for /ask, run in a small pool of pre-warmed worker processes.
+
+Each task gets a wall-clock timeout (the worker is killed and replaced when it
+overruns) and an RLIMIT_CPU / RLIMIT_AS budget inside the worker, so a huge
+exponent or a nasty integral costs one worker restart instead of a stuck
+request thread. Answers, including "not math", are kept in an LRU keyed by the
+canonicalised question; timeouts and crashed workers are not, so a question cut
+off while the machine was busy gets another try.
+"""
+import os
+import re
+import math
+import queue
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from typing import Optional
+
+log = logging.getLogger("msss")
+
+# ------------------ CONFIG ------------------ #
+MATH_WORKERS = int(os.getenv("MATH_WORKERS", "2"))
+MATH_TIMEOUT_S = float(os.getenv("MATH_TIMEOUT_S", "3"))
+MATH_CPU_S = int(os.getenv("MATH_CPU_S", "2"))
+MATH_MEMORY_MB = int(os.getenv("MATH_MEMORY_MB", "512"))
+MATH_CACHE_SIZE = int(os.getenv("MATH_CACHE_SIZE", "2048"))
+
+_SPACES = re.compile(r"\s+")
+
+
+def canonical(text: str) -> str:
+    """Cache key and worker input: 'Solve  2x^2 = 8 ' -> 'solve 2x**2 = 8'"""
+    text = text.lower().replace("^", "**").replace("×", "*").replace("÷", "/")
+    return _SPACES.sub(" ", text).strip()
+
+
+# ------------------ Solvers (run inside workers) ------------------ #
+def solve_math_expression(expr: str):
+    try:
+        import sympy as sp
+        expr = expr.lower().replace("^", "**").replace("×", "*").replace("÷", "/").strip()
+        x, y, z = sp.symbols("x y z")
+        allowed = {"sin": lambda deg: math.sin(math.radians(float(deg))),
+                   "cos": lambda deg: math.cos(math.radians(float(deg))),
+                   "tan": lambda deg: math.tan(math.radians(float(deg))),
+                   "asin": lambda val: math.degrees(math.asin(float(val))),
+                   "acos": lambda val: math.degrees(math.acos(float(val))),
+                   "atan": lambda val: math.degrees(math.atan(float(val))),
+                   "sqrt": math.sqrt,
+                   "log": math.log10,
+                   "ln": math.log,
+                   "pi": math.pi,
+                   "e": math.e,
+                   "pow": pow,
+                   }
+        if "=" in expr:
+            lhs, rhs = expr.split("=")
+            solution = sp.solve(sp.sympify(lhs) - sp.sympify(rhs), x)
+            if not solution:
+                return "No real solution found."
+            if len(solution) == 1:
+                return f"The value of x is {solution[0]}."
+            return f"Possible values of x are: {', '.join(map(str, solution))}."
+        try:
+            simplified = sp.simplify(expr)
+            if str(simplified) != expr:
+                expr = str(simplified)
+        except Exception:
+            pass
+        result = eval(expr, {"__builtins__": None}, allowed)
+        if isinstance(result, bool):
+            return None  # a comparison, not arithmetic
+        if isinstance(result, float):
+            result = round(result, 6)
+        return f"The result is {result}"
+    except Exception as e:
+        log.warning(f"⚠️ Math solver error: {e}")
+        return None
+
+
+def explain_math_step_by_step(expr: str):
+    import sympy as sp
+    x, y, z = sp.symbols("x y z")
+    try:
+        expr = expr.lower().replace("^", "**").replace("×", "*").replace("÷", "/")
+        if ("differentiate" in expr) or ("derivative" in expr) or ("find dy/dx" in expr):
+            target = expr.split("of")[-1].strip()
+            func = sp.sympify(target)
+            result = sp.diff(func, x)
+            return f"The derivative of {func} with respect to x is: {result}"
+        elif ("integrate" in expr) or ("integration" in expr):
+            target = expr.split("of")[-1].strip()
+            func = sp.sympify(target)
+            result = sp.integrate(func, x)
+            return f"The integral of {func} with respect to x is: {result} + C"
+        elif "=" in expr:
+            lhs, rhs = expr.split("=")
+            solution = sp.solve(sp.sympify(lhs) - sp.sympify(rhs), x)
+            steps = [f"Step 1️⃣: Start with {lhs} = {rhs}",
+                     f"Step 2️⃣: Move all terms to one side: ({lhs}) - ({rhs}) = 0",
+                     f"Step 3️⃣: Simplify and solve for x",
+                     f"✅ Solution: x = {solution}"]
+            return "\n".join(steps)
+        else:
+            simplified = sp.simplify(expr)
+            if isinstance(simplified, sp.logic.boolalg.Boolean):
+                return None  # True/False or a relation: sympy read words as symbols
+            return f"Simplified form: {simplified}"
+    except Exception:
+        return None
+
+
+def answer_math(text: str):
+    """Step-by-step explanation if sympy can give one, else a direct result, else None."""
+    return explain_math_step_by_step(text) or solve_math_expression(text)
+
+
+# ------------------ Worker Process ------------------ #
+def _limit_cpu(seconds: int):
+    # RLIMIT_CPU counts the whole process lifetime, so move the soft limit per task.
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime) + seconds + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn, cpu_s: int, memory_mb: int):
+    try:
+        import resource
+        if memory_mb > 0:
+            limit = memory_mb * 2**20
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+    import sympy  # noqa: F401  (pre-warm: the first task should not pay the import)
+
+    while True:
+        try:
+            text = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if text is None:
+            return
+        try:
+            _limit_cpu(cpu_s)
+        except Exception:
+            pass
+        try:
+            result = answer_math(text)
+        except MemoryError:
+            result = None
+        conn.send(result)
+
+
+class _Worker:
+    def __init__(self, ctx, cpu_s: int, memory_mb: int):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, cpu_s, memory_mb), name="math-worker", daemon=True)
+        self.proc.start()
+        child.close()
+
+    def terminate(self):
+        """End the process and wait for it (the pipe stays open for whoever is reading it)."""
+        if self.proc.is_alive():
+            self.proc.terminate()
+            self.proc.join(1)
+        if self.proc.is_alive():
+            self.proc.kill()
+        self.proc.join()
+
+    def kill(self):
+        try:
+            self.terminate()
+        finally:
+            self.conn.close()
+
+
+# ------------------ Engine ------------------ #
+class MathEngine:
+    def __init__(
+        self,
+        workers: int = MATH_WORKERS,
+        timeout: float = MATH_TIMEOUT_S,
+        cpu_s: int = MATH_CPU_S,
+        memory_mb: int = MATH_MEMORY_MB,
+        cache_size: int = MATH_CACHE_SIZE,
+    ):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.cpu_s = cpu_s
+        self.memory_mb = memory_mb
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.busy = 0
+        self._cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers: set = set()  # every live worker, idle or busy
+        self._lock = threading.Lock()
+        self._ctx = multiprocessing.get_context("spawn")
+        self._started = False
+
+    def _spawn(self) -> Optional[_Worker]:
+        worker = _Worker(self._ctx, self.cpu_s, self.memory_mb)
+        with self._lock:
+            if self._started:
+                self._workers.add(worker)
+                return worker
+        worker.kill()  # stop() ran meanwhile
+        return None
+
+    def _replace(self, worker: _Worker) -> Optional[_Worker]:
+        with self._lock:
+            self._workers.discard(worker)
+        worker.kill()
+        return self._spawn()
+
+    def _release(self, worker: _Worker):
+        with self._lock:
+            if worker in self._workers:
+                self._idle.put(worker)
+                return
+        worker.kill()
+
+    def start(self):
+        """Spawn the workers; each imports sympy right away."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.workers):
+            worker = self._spawn()
+            if worker is not None:
+                self._idle.put(worker)
+        log.info(f"🧮 Math engine: {self.workers} workers, {self.timeout}s timeout")
+
+    def stop(self):
+        """Terminate and join every worker, including ones in the middle of a task."""
+        with self._lock:
+            self._started = False
+            workers, self._workers = self._workers, set()
+        idle = set()
+        while True:
+            try:
+                idle.add(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for worker in idle:
+            worker.kill()
+        for worker in workers - idle:
+            worker.terminate()  # its solve() sees EOF and closes the pipe
+
+    def _remember(self, key: str, result: Optional[str]):
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def solve(self, text: str) -> Optional[str]:
+        """Blocking; call from a thread. None when sympy has no answer or the task was cut off."""
+        key = canonical(text)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+        if not self._started:
+            self.start()
+
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            self.busy += 1
+            log.warning("⚠️ Math workers busy; skipping sympy for this question")
+            return None
+
+        result, answered = None, False
+        try:
+            worker.conn.send(key)
+            if worker.conn.poll(self.timeout):
+                result, answered = worker.conn.recv(), True
+            else:
+                self.timeouts += 1
+                log.warning(f"⏱️ Math task exceeded {self.timeout}s, restarting worker: {key[:80]!r}")
+                worker = self._replace(worker)
+        except (EOFError, OSError):
+            # Killed by its CPU or memory limit (or by stop()).
+            if self._started:
+                self.crashes += 1
+                log.warning(f"⚠️ Math worker died on {key[:80]!r}; restarting")
+            worker = self._replace(worker)
+        finally:
+            if worker is not None:
+                self._release(worker)
+
+        if answered:
+            self._remember(key, result)
+        return result
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "workers": self.workers,
+            "live": len(self._workers),
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+            "busy": self.busy,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    import time
+
+    logging.basicConfig(level=logging.INFO)
+    engine = MathEngine()
+    engine.start()
+    questions = [
+        "solve 2*x + 3 = 11",
+        "differentiate of x**3 + 2*x",
+        "integrate of sin(x)*x",
+        "what is the fee for class 5",
+        "2**2**2**2**2**2**30",
+        "integrate of exp(x**x)*sin(x**x)/log(x)",
+    ]
+    for rnd in ("cold", "cached"):
+        for q in questions:
+            start = time.perf_counter()
+            answer = engine.solve(q)
+            print(f"{rnd:6s} {(time.perf_counter() - start) * 1000:8.1f} ms  {q[:40]:40s} -> {str(answer)[:50]!r}")
+    print(engine.stats())
+    engine.stop()
@@ -0,0 +1,130 @@
+"""
+Conversation memory for /ask as a fixed-size ring buffer.
+
+Embeddings are cut to their first MEMORY_DIM components and L2-normalised once
+on insert into a preallocated float32 matrix, so a lookup is one matrix-vector
+product plus argpartition for the top-k. text-embedding-3 vectors keep their
+meaning when shortened this way. When full, the oldest entry is overwritten.
+Entries added without an embedding are kept for recent() but never returned by
+top_k().
+
+A lookup reads the whole matrix (capacity x MEMORY_DIM x 4 bytes), so its cost
+is set by memory bandwidth: well under a millisecond while the matrix fits in
+cache, several times that once it doesn't (about 10k entries at 256 dims).
+Capacity is therefore capped at MEMORY_MAX_CAPACITY, which keeps a lookup
+under 1 ms (0.3-0.5 ms measured).
+"""
+import os
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ------------------ CONFIG ------------------ #
+MEMORY_MAX_CAPACITY = 5000
+MEMORY_CAPACITY = min(int(os.getenv("MEMORY_CAPACITY", "1000")), MEMORY_MAX_CAPACITY)
+MEMORY_DIM = int(os.getenv("MEMORY_DIM", "256"))
+
+
+# ------------------ Store ------------------ #
+class MemoryStore:
+    def __init__(self, dim: int = MEMORY_DIM, capacity: int = MEMORY_CAPACITY):
+        self.dim = dim
+        self.capacity = max(1, min(capacity, MEMORY_MAX_CAPACITY))
+        self._vecs = np.zeros((self.capacity, dim), dtype=np.float32)
+        self._has_vec = np.zeros(self.capacity, dtype=bool)
+        self._with_vecs = 0
+        self._items: List[Optional[Tuple[str, str]]] = [None] * self.capacity
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def add(self, question: str, answer: str, embedding: Optional[Sequence[float]] = None):
+        row = np.zeros(self.dim, dtype=np.float32)
+        norm = 0.0
+        if embedding is not None and len(embedding) >= self.dim:
+            row[:] = embedding[: self.dim]
+            norm = float(np.linalg.norm(row))
+            if norm:
+                row /= norm
+        with self._lock:
+            self._with_vecs += bool(norm) - bool(self._has_vec[self._next])
+            self._has_vec[self._next] = bool(norm)
+            self._vecs[self._next] = row
+            self._items[self._next] = (question, answer)
+            self._next = (self._next + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def top_k(self, embedding: Sequence[float], k: int = 5) -> List[Tuple[float, str, str]]:
+        """Best `k` entries by cosine similarity, highest first, as (score, question, answer)."""
+        if not self._with_vecs or k <= 0:
+            return []
+        q = np.asarray(embedding, dtype=np.float32)[: self.dim]
+        if q.shape != (self.dim,):
+            return []
+        norm = float(np.linalg.norm(q))
+        if norm:
+            q = q / norm
+        with self._lock:
+            scores = self._vecs[: self._size] @ q
+            if self._with_vecs < self._size:
+                scores[~self._has_vec[: self._size]] = -np.inf  # entries stored without an embedding
+            k = min(k, self._with_vecs)
+            idx = np.argpartition(scores, -k)[-k:]
+            idx = idx[np.argsort(-scores[idx], kind="stable")]
+            return [(float(scores[i]), *self._items[i]) for i in idx]
+
+    def recent(self, n: int) -> List[Tuple[str, str]]:
+        """Last `n` (question, answer) pairs, oldest first."""
+        with self._lock:
+            n = min(n, self._size)
+            start = (self._next - n) % self.capacity
+            return [self._items[(start + i) % self.capacity] for i in range(n)]
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    import time
+    import random
+
+    dim, n = 1536, int(os.getenv("BENCH_ENTRIES", str(MEMORY_MAX_CAPACITY)))
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    query = rng.standard_normal(dim).tolist()
+
+    store = MemoryStore(capacity=n)
+    for i, v in enumerate(vectors):
+        store.add(f"q{i}", f"a{i}", v)
+
+    legacy = [{"question": f"q{i}", "answer": f"a{i}", "embedding": v.tolist()} for i, v in enumerate(vectors[:2000])]
+
+    def cosine(a, b):
+        dot = sum(x * y for x, y in zip(a, b))
+        return dot / ((sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5))
+
+    start = time.perf_counter()
+    sorted(((cosine(query, e["embedding"]), e) for e in legacy), key=lambda x: x[0], reverse=True)[:5]
+    py_ms = (time.perf_counter() - start) * 1000
+
+    legacy_bytes = 8 * dim + 28 * dim  # list slots + float objects per entry
+    print(f"pure python, 2000 entries: {py_ms:9.2f} ms/query, ~{legacy_bytes // 1024} KiB/entry")
+
+    runs = 200
+    for size in sorted({20, MEMORY_CAPACITY, min(n, MEMORY_MAX_CAPACITY)}):
+        sized = store if size == store.capacity else MemoryStore(capacity=size)
+        if sized is not store:
+            for i, v in enumerate(vectors[:size]):
+                sized.add(f"q{i}", f"a{i}", v)
+        sized.top_k(query, 5)
+        start = time.perf_counter()
+        for _ in range(runs):
+            sized.top_k(query, 5)
+        np_ms = (time.perf_counter() - start) * 1000 / runs
+        print(f"MemoryStore, {size:6d} entries: {np_ms:7.3f} ms/query, scans {sized._vecs.nbytes / 2**20:5.1f} MiB"
+              f"{'' if np_ms < 1 else '  (over the 1 ms budget)'}")
+    print(f"top hit: {store.top_k(vectors[random.randrange(store.capacity)], 1)[0][:2]}")
+    store.add("no embedding", "a", None)
+    print(f"entry without an embedding returned: {any(q == 'no embedding' for _, q, _ in store.top_k(query, n))}")
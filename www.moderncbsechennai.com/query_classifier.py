@@ -0,0 +1,166 @@
+"""
+Cheap routing decisions for /ask, made before any sympy, embedding or LLM work.
+
+is_math() sends a question to the sympy workers only when it is an expression
+("2x^2 + 3 = 11", "sqrt(144) * 3") or a math instruction with something to
+work on ("differentiate x^3", "integrate of sin(x)"). School questions that
+merely contain digits, dashes or words like "log"/"tan" ("fees for 5th class",
+"2024-25 timetable", "login page") stay on the retrieval path, and so do bare
+dates and academic years ("10/2/2024", "2024-25").
+math_expression() returns what the workers should solve: the bare expression
+("what is 7 × 6" -> "7 * 6") or the whole instruction ("differentiate x^3").
+"""
+import re
+from typing import Optional
+
+# ------------------ Patterns ------------------ #
+_INSTRUCTION = re.compile(
+    r"\b(differentiat\w*|derivative|d/dx|dy/dx|integrat\w*|simplify|factori[sz]e|expand|"
+    r"solve|evaluate|calculate|compute|roots?\s+of|square\s+root|cube\s+root)\b"
+)
+# Something an instruction can act on: a variable term, a function call, an operator between operands.
+_OPERAND = re.compile(
+    r"\b(sin|cos|tan|asin|acos|atan|log|ln|sqrt|exp)\s*\(|"
+    r"(?<![a-z])[xyz](?![a-z])|"
+    r"[\d)]\s*(\*\*|[-+*/^×÷])\s*[\d(a-z]|"
+    r"\d\s*%\s*of\s*\d"
+)
+_FUNCS = re.compile(r"\b(sin|cos|tan|asin|acos|atan|log|ln|sqrt|exp|pi|e)\b")
+_CALL = re.compile(r"\b(sin|cos|tan|asin|acos|atan|log|ln|sqrt|exp)\s*\(")
+_PREFIX = re.compile(r"^(what\s+is|what's|find|calculate|compute|evaluate|solve)\s+")
+_EXPR_CHARS = re.compile(r"^[\d\s.+\-*/^×÷()=xyz,]+$")
+_OPERATOR = re.compile(r"[-+*/^×÷=]")
+_HAS_VALUE = re.compile(r"[\dxyz]")
+_DATE = re.compile(
+    r"(?<![\d/-])(?:\d{1,2}([/-])\d{1,2}\1\d{2,4}|\d{4}([/-])\d{1,2}\2\d{1,2}"
+    r"|((?:19|20)\d\d)\s*[-/]\s*(\d\d|(?:19|20)\d\d))(?![\d/-])"
+)
+
+
+def _strip_dates(text: str) -> str:
+    """Blank out dates ('10/2/2024', '2024-02-10') and academic years ('2024-25', '2023/2024')."""
+    def blank(m):
+        start, end = m.group(3), m.group(4)
+        if start and int(end) % 100 != (int(start) + 1) % 100:
+            return m.group(0)  # '2025 - 2024' is a subtraction
+        return " "
+    return _DATE.sub(blank, text)
+
+
+def math_expression(text: str) -> Optional[str]:
+    """Input for the sympy workers, or None when `text` is not math."""
+    q = text.lower().strip().rstrip("?.! ")
+    if not q:
+        return None
+    # Bare expression: nothing left but numbers, x/y/z, operators and known functions.
+    expr = _PREFIX.sub("", q)
+    bare = _FUNCS.sub("", expr)
+    if not _strip_dates(expr).strip():
+        return None
+    if _EXPR_CHARS.match(bare) and _HAS_VALUE.search(bare) and (_OPERATOR.search(bare) or _CALL.search(expr)):
+        return expr.replace("×", "*").replace("÷", "/").strip()
+    if _INSTRUCTION.search(q) and _OPERAND.search(_strip_dates(q)):
+        return q.replace("×", "*").replace("÷", "/")
+    return None
+
+
+def is_math(text: str) -> bool:
+    return math_expression(text) is not None
+
+
+# ------------------ Labelled Set ------------------ #
+LABELLED = [
+    ("2+2", True),
+    ("what is 12*8?", True),
+    ("sqrt(144) * 3", True),
+    ("2x^2 + 3 = 11", True),
+    ("x**2 - 5*x + 6 = 0", True),
+    ("differentiate x^3 + 2x", True),
+    ("find the derivative of sin(x)*x", True),
+    ("integrate of sin(x)", True),
+    ("integration of x**2", True),
+    ("simplify (x+1)**2 - x**2", True),
+    ("solve 2*x + 3 = 11", True),
+    ("calculate 15% of 2400", True),
+    ("evaluate 3.5 * (4 - 1)", True),
+    ("what is 7 × 6", True),
+    ("100 ÷ 4", True),
+    ("log(100) + 1", True),
+    ("tan(45)", True),
+    ("roots of x^2 - 4", True),
+    ("What is 25/5?", True),
+    ("cos(60) + sin(30)", True),
+    ("What is the fee structure for 5th class?", False),
+    ("fees for 5th class", False),
+    ("contact number", False),
+    ("What are the school timings?", False),
+    ("Who is the principal?", False),
+    ("2024-25 academic calendar", False),
+    ("admission for LKG (2025)", False),
+    ("is there a bus to T.Nagar?", False),
+    ("how do I login to the parent portal", False),
+    ("tell me about the tanjore trip", False),
+    ("class 10 board exam dates", False),
+    ("what is the phone number 044-22241234", False),
+    ("school bus route 12 timing", False),
+    ("Do you have a science lab?", False),
+    ("solve my admission problem", False),
+    ("fees for class 11 - science stream", False),
+    ("is the 3rd term exam in march", False),
+    ("what is the uniform colour", False),
+    ("grade 1 to grade 5 fee", False),
+    ("can i pay fees in 2 installments", False),
+    ("10/2/2024", False),
+    ("2024-25", False),
+    ("what is 2024-2025", False),
+    ("2023/24", False),
+    ("2024-02-10", False),
+    ("calculate the fee for 2024-25", False),
+    ("12-4", True),
+    ("2025 - 2024", True),
+]
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    import time
+
+    from math_engine import MathEngine
+
+    legacy = re.compile(r"d/dx|dx|differentiate|derive|integrate|roots|equation|simplify|sin|cos|tan|log|sqrt|=|[\d+\-*/^()]")
+
+    def score(route):
+        wrong = [(q, want) for q, want in LABELLED if route(q) != want]
+        tp = sum(1 for q, want in LABELLED if want and route(q))
+        fp = sum(1 for q, want in LABELLED if not want and route(q))
+        fn = sum(1 for q, want in LABELLED if want and not route(q))
+        return wrong, tp / max(1, tp + fp), tp / max(1, tp + fn)
+
+    for name, route in (("legacy regex", lambda q: bool(legacy.search(q))), ("is_math", is_math)):
+        wrong, precision, recall = score(route)
+        print(f"{name:12s}: precision {precision:.2f}, recall {recall:.2f}, {len(wrong)} wrong")
+        for q, want in wrong:
+            print(f"    {'missed' if want else 'false positive'}: {q!r}")
+
+    runs = 2000
+    start = time.perf_counter()
+    for _ in range(runs):
+        for q, _ in LABELLED:
+            is_math(q)
+    print(f"is_math: {(time.perf_counter() - start) * 1e6 / (runs * len(LABELLED)):.1f} µs/question")
+
+    # Per-route latency up to the start of retrieval, with the sympy result cache disabled.
+    engine = MathEngine(cache_size=0)
+    engine.start()
+    engine.solve("1+1")  # wait for the workers to finish importing sympy
+    for name, route in (("legacy regex", lambda q: bool(legacy.search(q))), ("is_math", is_math)):
+        totals = {True: [], False: []}
+        for q, want in LABELLED:
+            start = time.perf_counter()
+            if route(q):
+                engine.solve(math_expression(q) or q)
+            totals[want].append(time.perf_counter() - start)
+        for want, label in ((False, "school questions"), (True, "math questions")):
+            vals = totals[want]
+            print(f"{name:12s} {label:16s}: mean {sum(vals) / len(vals) * 1000:7.2f} ms, max {max(vals) * 1000:7.2f} ms")
+    engine.stop()
@@ -0,0 +1,205 @@
+"""
+Semantic cache for RAG answers from the LLM.
+
+An answer is stored under the retrieved chunks it was generated from (a
+fingerprint of their source + content hash) and the live index key
+(vector.index_key). Answers whose prompt carried a session's conversation
+memory are also keyed by that session, so one visitor's turns never reach
+another. A later question is served from the cache when it
+retrieved exactly the same chunks from the same index and is either the same
+question after normalisation or its embedding is at least
+ANSWER_CACHE_THRESHOLD cosine-similar. Editing a file changes its chunk hashes
+and the index key, so an answer is never served for content it was not
+generated from; the whole cache is also dropped when the index changes.
+Entries expire after ANSWER_CACHE_TTL_S and are evicted least-recently-used.
+"""
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from faq import normalize_question
+
+# ------------------ CONFIG ------------------ #
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "21600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+
+# Questions about the conversation itself ("what did I ask now?") depend on memory, not on the chunks.
+_CONVERSATIONAL = re.compile(r"\b(what did i|i asked|i said|you said|previous|earlier|last (question|answer)|again)\b")
+
+
+def is_conversational(question: str) -> bool:
+    return bool(_CONVERSATIONAL.search(question.lower()))
+
+
+class CacheKey(NamedTuple):
+    question: str                     # normalize_question() form
+    embedding: Optional[np.ndarray]   # unit vector, or None on the lexical-only path
+    chunks: str                       # fingerprint of the retrieved chunks
+    index: str                        # vector.index_key()
+    session: Optional[str] = None     # set when the prompt included this session's memory turns
+
+
+def chunk_fingerprint(docs: Iterable) -> str:
+    """Order-insensitive digest of the retrieved chunks' (source, hash)."""
+    ids = sorted(f"{d.metadata.get('source')}:{d.metadata.get('hash')}" for d in docs)
+    return hashlib.sha1("\n".join(ids).encode("utf-8")).hexdigest()
+
+
+def make_key(question: str, embedding: Optional[Sequence[float]], docs: Sequence, index: Optional[str],
+             session: Optional[str] = None) -> Optional[CacheKey]:
+    """None when the answer must not be cached: no index, no retrieved chunks, or a question about the chat."""
+    if index is None or not docs or is_conversational(question):
+        return None
+    vec = None
+    if embedding is not None:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        vec = vec / norm if norm else None
+    return CacheKey(normalize_question(question), vec, chunk_fingerprint(docs), index, session)
+
+
+class _Entry(NamedTuple):
+    answer: str
+    embedding: Optional[np.ndarray]
+    created: float
+
+
+# ------------------ Cache ------------------ #
+class ResponseCache:
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl_s: float = ANSWER_CACHE_TTL_S,
+                 capacity: int = ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.capacity = capacity
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._index: Optional[str] = None
+        self._entries: "OrderedDict[Tuple[str, str, Optional[str], str], _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, str, Optional[str]], Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _drop(self, k: Tuple[str, str, Optional[str], str]):
+        self._entries.pop(k, None)
+        bucket = self._buckets.get(k[:3])
+        if bucket is not None:
+            bucket.discard(k[3])
+            if not bucket:
+                del self._buckets[k[:3]]
+
+    def lookup(self, key: Optional[CacheKey]) -> Optional[str]:
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            k = (key.chunks, key.index, key.session, key.question)
+            entry = self._entries.get(k)
+            if entry is not None and now - entry.created <= self.ttl_s:
+                self._entries.move_to_end(k)
+                self.hits += 1
+                return entry.answer
+            best, best_score = None, self.threshold
+            if key.embedding is not None:
+                for question in list(self._buckets.get(k[:3], ())):
+                    other = (*k[:3], question)
+                    entry = self._entries[other]
+                    if now - entry.created > self.ttl_s:
+                        self._drop(other)
+                        continue
+                    if entry.embedding is not None and entry.embedding.shape == key.embedding.shape:
+                        score = float(entry.embedding @ key.embedding)
+                        if score >= best_score:
+                            best, best_score = other, score
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            self.semantic_hits += 1
+            return self._entries[best].answer
+
+    def store(self, key: Optional[CacheKey], answer: str):
+        if key is None or not answer:
+            return
+        with self._lock:
+            if key.index != self._index:
+                return  # generated against an index that has since been replaced
+            k = (key.chunks, key.index, key.session, key.question)
+            self._entries[k] = _Entry(answer, key.embedding, time.time())
+            self._entries.move_to_end(k)
+            self._buckets.setdefault(k[:3], set()).add(key.question)
+            while len(self._entries) > self.capacity:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def set_index(self, index: Optional[str]):
+        """Called after every index refresh; a different index drops every entry."""
+        with self._lock:
+            if index == self._index:
+                return
+            if self._entries:
+                self.invalidations += 1
+            self._index = index
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "index": self._index,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    from types import SimpleNamespace
+
+    # Synthetic traffic: 200 topics, each asked in a few wordings. A paraphrase's embedding is
+    # the topic vector plus noise (cosine ~0.96 between wordings); different topics are unrelated.
+    rng = np.random.default_rng(0)
+    dim, topics = 1536, 200
+    centres = rng.standard_normal((topics, dim)).astype(np.float32)
+    chunks = [[SimpleNamespace(metadata={"source": f"f{t % 7}.txt", "hash": f"{t}-{j}"}) for j in range(3)]
+              for t in range(topics)]
+
+    def paraphrase(t):
+        return centres[t] + rng.standard_normal(dim).astype(np.float32) * 0.2
+
+    cache = ResponseCache(capacity=1024)
+    cache.set_index("1:local")
+    stream = rng.zipf(1.3, 5000) % topics
+    llm_calls = wrong = 0
+    lookup_s = 0.0
+    for i, t in enumerate(stream):
+        q = f"question {t} wording {rng.integers(4)}"
+        key = make_key(q, paraphrase(t), chunks[t], "1:local")
+        start = time.perf_counter()
+        answer = cache.lookup(key)
+        lookup_s += time.perf_counter() - start
+        if answer is None:
+            llm_calls += 1
+            cache.store(key, f"answer {t}")
+        elif answer != f"answer {t}":
+            wrong += 1
+    print(f"{len(stream)} questions over {topics} topics: {llm_calls} LLM calls, "
+          f"{len(stream) - llm_calls} served from cache, {wrong} wrong answers")
+    print(f"lookup: {lookup_s * 1e6 / len(stream):.1f} µs/question; stats {cache.stats()}")
+    cache.set_index("2:local")
+    print(f"after an index refresh: {cache.stats()['entries']} entries, "
+          f"lookup -> {cache.lookup(make_key('question 0 wording 0', centres[0], chunks[0], '2:local'))}")
@@ -0,0 +1,161 @@
+"""
+Per-session conversation state for /ask.
+
+Each browser session (the `session_id` the chat widget keeps in localStorage)
+gets its own turn log and its own MemoryStore, so one parent's questions never
+show up in another's memory retrieval. Sessions idle for SESSION_TTL_S are
+evicted, and at most SESSION_MAX are kept (least recently used go first).
+
+Turns are numbered from 1; a cursor is "the number of turns so far". /ask
+returns the cursor after the new turn, and history() pages backwards from any
+cursor, so responses stay the same size however long the server runs.
+"""
+import os
+import time
+import secrets
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+from memory_store import MemoryStore
+
+# ------------------ CONFIG ------------------ #
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "1800"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "2000"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "200"))
+SESSION_MEMORY_TURNS = int(os.getenv("SESSION_MEMORY_TURNS", "20"))
+HISTORY_PAGE = 20
+SWEEP_EVERY_S = 60.0
+
+
+# ------------------ Session ------------------ #
+class Session:
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.memory = MemoryStore(capacity=SESSION_MEMORY_TURNS)
+        self.total = 0
+        self.last_seen = time.monotonic()
+        self._turns: "deque[Tuple[str, str]]" = deque(maxlen=SESSION_MAX_TURNS)
+        self._lock = threading.Lock()
+
+    def add_turn(self, question: str, answer: str) -> int:
+        """Log a turn; returns the cursor after it."""
+        with self._lock:
+            self._turns.append((question, answer))
+            self.total += 1
+            return self.total
+
+    def history(self, cursor: Optional[int] = None, limit: int = HISTORY_PAGE) -> Tuple[List[dict], Optional[int]]:
+        """
+        Up to `limit` turns before `cursor` (default: the latest), oldest first, and the
+        cursor for the page before them (None when nothing older is kept).
+        """
+        with self._lock:
+            first = self.total - len(self._turns) + 1  # number of the oldest turn still kept
+            end = self.total if cursor is None else max(0, min(cursor, self.total))
+            start = max(first, end - max(0, limit) + 1)
+            turns = [
+                {"turn": n, "question": q, "answer": a}
+                for n, (q, a) in zip(range(start, end + 1), list(self._turns)[start - first: end - first + 1])
+            ]
+            return turns, (start - 1 if start > first else None)
+
+
+# ------------------ Store ------------------ #
+class SessionStore:
+    def __init__(self, ttl_s: float = SESSION_TTL_S, max_sessions: int = SESSION_MAX):
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _sweep(self, now: float):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen < self.ttl_s:
+                break
+            del self._sessions[oldest.id]
+            self.expired += 1
+        self._last_sweep = now
+
+    def get(self, session_id: Optional[str]) -> Session:
+        """The live session for `session_id`, or a new one (with a new id) if it is unknown or expired."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep >= SWEEP_EVERY_S:
+                self._sweep(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None and now - session.last_seen >= self.ttl_s:
+                del self._sessions[session.id]
+                self.expired += 1
+                session = None
+            if session is None:
+                session = Session(secrets.token_urlsafe(16))
+                self._sessions[session.id] = session
+                self.created += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            session.last_seen = now
+            self._sessions.move_to_end(session.id)
+            return session
+
+    def find(self, session_id: Optional[str]) -> Optional[Session]:
+        """The live session for `session_id` without creating or touching one."""
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None and time.monotonic() - session.last_seen >= self.ttl_s:
+                return None
+            return session
+
+    def end(self, session_id: Optional[str]) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None if session_id else False
+
+    def export(self, turns: int = 50) -> Dict[str, List[dict]]:
+        """Latest `turns` of every live session (for the shutdown snapshot)."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {s.id: s.history(limit=turns)[0] for s in sessions}
+
+    def stats(self) -> dict:
+        return {
+            "live": len(self._sessions),
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    import json
+
+    answer = "**School Timings** 🕗\n\n• Classes run 8:00 am to 3:15 pm\n\n• Saturdays end at 12:30 pm\n\n🟡 Want more?"
+    store = SessionStore()
+    history = []  # the old module-global conversation_history
+    session = store.get(None)
+    checkpoints = {10, 1000, 10000}
+    for n in range(1, max(checkpoints) + 1):
+        q = f"question {n} about the school"
+        history.append({"question": q, "answer": answer})
+        cursor = session.add_turn(q, answer)
+        if n in checkpoints:
+            runs = 20
+            for name, body in (("full history", {"answer": answer, "history": history}),
+                               ("delta + cursor", {"answer": answer, "session_id": session.id, "cursor": cursor})):
+                start = time.perf_counter()
+                for _ in range(runs):
+                    payload = json.dumps(body, ensure_ascii=False)
+                ms = (time.perf_counter() - start) * 1000 / runs
+                print(f"after {n:5d} turns, {name:14s}: {len(payload.encode()):9,d} bytes, encode {ms:7.3f} ms")
+
+    page, older = session.history(limit=3)
+    print(f"latest page: turns {[t['turn'] for t in page]}, next cursor {older}; "
+          f"kept turns {session.total - SESSION_MAX_TURNS + 1}..{session.total}")
+    other = store.get(None)
+    print(f"a second session sees {len(other.memory)} memory entries and {other.history()[0]} history")
@@ -0,0 +1,121 @@
+"""
+Single-flight coalescing for /ask sub-questions.
+
+At announcement peaks many clients send the same question within seconds.
+SingleFlight.do(key, fn) runs `fn` once per key at a time: callers that
+arrive while it is in flight await the same result (or the same exception)
+instead of starting their own retrieval + LLM call. If the leading caller is
+cancelled (client went away), waiting callers retry and one of them leads.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self.leaders = 0
+        self.shared = 0
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        while (fut := self._calls.get(key)) is not None:
+            self.shared += 1
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise  # this caller was cancelled, not the leader
+                self.shared -= 1
+
+        fut = asyncio.get_running_loop().create_future()
+        self._calls[key] = fut
+        self.leaders += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved: no "never retrieved" warning when nobody was waiting
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is fut:
+                del self._calls[key]
+
+    def stats(self) -> dict:
+        total = self.leaders + self.shared
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "shared_rate": round(self.shared / total, 4) if total else 0.0,
+        }
+
+
+# ------------------ CLI Benchmark ------------------ #
+if __name__ == "__main__":
+    import time
+
+    N, LLM_S, SLOTS = 50, 0.3, 8  # SLOTS: concurrent upstream calls the LLM client allows
+
+    async def burst(coalesce: bool):
+        flight = SingleFlight()
+        slots = asyncio.Semaphore(SLOTS)
+        calls = 0
+
+        async def answer():
+            nonlocal calls
+            async with slots:
+                calls += 1
+                await asyncio.sleep(LLM_S)
+            return "ANSWER"
+
+        async def request(i):
+            await asyncio.sleep(i * 0.002)  # arrivals spread over ~0.1 s
+            start = time.perf_counter()
+            if coalesce:
+                await flight.do("what are the school timings", answer)
+            else:
+                await answer()
+            return time.perf_counter() - start
+
+        latencies = sorted(await asyncio.gather(*(request(i) for i in range(N))))
+        return calls, latencies
+
+    async def errors():
+        flight = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.05)
+            raise RuntimeError("upstream 500")
+
+        results = await asyncio.gather(*(flight.do("q", boom) for _ in range(5)), return_exceptions=True)
+        print(f"errors: {len(results)} callers, {flight.leaders} call, "
+              f"all got {sorted({type(r).__name__ + ': ' + str(r) for r in results})}")
+
+    async def cancelled():
+        flight = SingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.1)
+            return "ANSWER"
+
+        leader = asyncio.create_task(flight.do("q", slow))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do("q", slow))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        print(f"leader cancelled: follower still got {await follower!r} ({flight.leaders} leaders)")
+
+    for coalesce in (False, True):
+        calls, lat = asyncio.run(burst(coalesce))
+        print(f"{'single-flight' if coalesce else 'independent':13s}: {N} identical requests -> {calls} LLM calls, "
+              f"p50 {lat[N // 2] * 1000:.0f} ms, p99 {lat[int(N * 0.99)] * 1000:.0f} ms")
+    asyncio.run(errors())
+    asyncio.run(cancelled())
@@ -0,0 +1,282 @@
+"""
+Versioned, prebuilt FAISS index snapshots shared by every serving instance.
+
+A snapshot is the contents of vector.VECTOR_STORE_PATH (FAISS index, chunk
+store, chunk manifest) plus snapshot.json: the version, the embedding model,
+the bucket fingerprints of the source files it was built from and a sha256
+per file. Snapshots live under snapshots/<version>/ in the bucket (or in
+SNAPSHOT_DIR, a local directory standing in for it) and snapshots/LATEST
+names the current one.
+
+    python snapshot.py build     # sync + incremental index update, then publish if changed
+    python snapshot.py pull      # download and verify LATEST into faiss_index/
+    python snapshot.py list
+
+Serving instances pull LATEST at startup (see vector.load_vector_store), so
+a new replica only embeds chunks that changed after the snapshot was built.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from index_store import commit_dir, stage_dir
+
+log = logging.getLogger("msss")
+
+# ------------------ CONFIG ------------------ #
+SNAPSHOT_MODE = os.getenv("INDEX_SNAPSHOTS", "auto").lower()  # auto | off
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR")                      # local stand-in for the bucket
+SNAPSHOT_BUCKET = os.getenv("SNAPSHOT_BUCKET", "msss-text-files")
+SNAPSHOT_PREFIX = "snapshots"
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "5"))
+SNAPSHOT_META = "snapshot.json"
+LATEST = "LATEST"
+
+
+def enabled() -> bool:
+    return SNAPSHOT_MODE != "off"
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# ------------------ Stores ------------------ #
+class LocalStore:
+    """Directory with the same layout as the bucket prefix."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, SNAPSHOT_PREFIX, name)
+
+    def read_text(self, name: str) -> Optional[str]:
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def write_text(self, name: str, text: str):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+
+    def upload(self, local_path: str, name: str):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(local_path, path)
+
+    def download(self, name: str, local_path: str):
+        shutil.copyfile(self._path(name), local_path)
+
+    def versions(self) -> List[str]:
+        root = self._path("")
+        if not os.path.isdir(root):
+            return []
+        return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+
+    def delete_version(self, version: str):
+        shutil.rmtree(self._path(version), ignore_errors=True)
+
+
+class BucketStore:
+    def __init__(self, bucket_name: str = SNAPSHOT_BUCKET):
+        import google.auth
+        from google.cloud import storage
+
+        credentials, project = google.auth.default()
+        self.bucket = storage.Client(credentials=credentials, project=project).bucket(bucket_name)
+
+    def _blob(self, name: str):
+        return self.bucket.blob(f"{SNAPSHOT_PREFIX}/{name}")
+
+    def read_text(self, name: str) -> Optional[str]:
+        blob = self._blob(name)
+        if not blob.exists():
+            return None
+        return blob.download_as_text()
+
+    def write_text(self, name: str, text: str):
+        self._blob(name).upload_from_string(text, content_type="text/plain")
+
+    def upload(self, local_path: str, name: str):
+        self._blob(name).upload_from_filename(local_path)
+
+    def download(self, name: str, local_path: str):
+        self._blob(name).download_to_filename(local_path)
+
+    def versions(self) -> List[str]:
+        blobs = self.bucket.list_blobs(prefix=f"{SNAPSHOT_PREFIX}/", delimiter="/")
+        list(blobs)  # prefixes are only filled once the listing has been consumed
+        return sorted(p[len(SNAPSHOT_PREFIX) + 1:].rstrip("/") for p in blobs.prefixes)
+
+    def delete_version(self, version: str):
+        for blob in self.bucket.list_blobs(prefix=f"{SNAPSHOT_PREFIX}/{version}/"):
+            blob.delete()
+
+
+def get_store():
+    return LocalStore(SNAPSHOT_DIR) if SNAPSHOT_DIR else BucketStore()
+
+
+# ------------------ Metadata ------------------ #
+def new_version(sources: Dict[str, Dict[str, str]]) -> str:
+    """'20261018T110619Z-1a2b3c4d': sortable build time + digest of the source fingerprints."""
+    digest = hashlib.sha256(json.dumps(sources, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+    return time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + digest
+
+
+def read_local_meta(index_dir: str) -> Optional[dict]:
+    path = os.path.join(index_dir, SNAPSHOT_META)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def mark_local_changes(index_dir: str, new_dir: str):
+    """
+    Give `new_dir` (a locally updated copy of `index_dir`) the snapshot meta of
+    `index_dir` with "version" None and "base" the snapshot it was built from,
+    so pull_latest skips that snapshot.
+    """
+    meta = read_local_meta(index_dir)
+    base = meta and (meta.get("version") or meta.get("base"))
+    if not base:
+        return
+    with open(os.path.join(new_dir, SNAPSHOT_META), "w") as f:
+        json.dump({**meta, "version": None, "base": base}, f, indent=2, sort_keys=True)
+
+
+def latest_version(store=None) -> Optional[str]:
+    store = store or get_store()
+    text = store.read_text(LATEST)
+    return text.strip() if text else None
+
+
+# ------------------ Publish ------------------ #
+def publish(index_dir: str, sources: Dict[str, Dict[str, str]], embed_model: str, embed_dim: int, store=None) -> str:
+    """Upload `index_dir` as a new snapshot and point LATEST at it. Returns the version."""
+    store = store or get_store()
+    version = new_version(sources)
+    files = {}
+    for name in sorted(os.listdir(index_dir)):
+        path = os.path.join(index_dir, name)
+        if name == SNAPSHOT_META or not os.path.isfile(path):
+            continue
+        files[name] = {"sha256": _sha256_file(path), "bytes": os.path.getsize(path)}
+        store.upload(path, f"{version}/{name}")
+
+    meta = {
+        "version": version,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "embed_model": embed_model,
+        "embed_dim": embed_dim,
+        "sources": sources,
+        "files": files,
+    }
+    with open(os.path.join(index_dir, SNAPSHOT_META), "w") as f:
+        json.dump(meta, f, indent=2, sort_keys=True)
+    # Metadata after the files and LATEST last, so a reader never sees a partial snapshot.
+    store.write_text(f"{version}/{SNAPSHOT_META}", json.dumps(meta, indent=2, sort_keys=True))
+    store.write_text(LATEST, version)
+    print(f"📦 Published index snapshot {version} ({len(files)} files)")
+
+    for old in store.versions()[:-SNAPSHOT_KEEP] if SNAPSHOT_KEEP > 0 else []:
+        if old != version:
+            store.delete_version(old)
+            print(f"🗑 Pruned snapshot {old}")
+    return version
+
+
+# ------------------ Pull ------------------ #
+def pull_latest(index_dir: str, embed_model: str, embed_dim: int, store=None) -> Optional[dict]:
+    """
+    Make `index_dir` hold the LATEST snapshot. Skips the download when it already
+    does, or holds it plus local changes (see mark_local_changes); otherwise
+    downloads into a staged dir, verifies every file's sha256 and swaps the
+    directory in. Returns the snapshot metadata, or None if there is no usable
+    snapshot (the caller then builds locally).
+    """
+    store = store or get_store()
+    version = latest_version(store)
+    if not version:
+        print("ℹ️ No index snapshot published yet")
+        return None
+
+    local = read_local_meta(index_dir)
+    if local and local.get("version") == version:
+        print(f"✔ Index snapshot {version} already local")
+        return local
+    if local and local.get("base") == version:
+        print(f"✔ Local index is snapshot {version} plus newer bucket changes")
+        return local
+
+    meta = json.loads(store.read_text(f"{version}/{SNAPSHOT_META}") or "null")
+    if not meta:
+        log.warning(f"⚠️ Snapshot {version} has no {SNAPSHOT_META}; ignoring it")
+        return None
+    if meta.get("embed_model") != embed_model or meta.get("embed_dim") != embed_dim:
+        log.warning(f"⚠️ Snapshot {version} was built with {meta.get('embed_model')}/{meta.get('embed_dim')}; "
+                    f"this instance uses {embed_model}/{embed_dim}. Building locally instead.")
+        return None
+
+    start = time.perf_counter()
+    tmp_dir = stage_dir(index_dir)
+    try:
+        for name, info in meta["files"].items():
+            path = os.path.join(tmp_dir, name)
+            store.download(f"{version}/{name}", path)
+            if _sha256_file(path) != info["sha256"]:
+                raise ValueError(f"checksum mismatch for {name}")
+        with open(os.path.join(tmp_dir, SNAPSHOT_META), "w") as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        log.warning(f"⚠️ Snapshot {version} failed verification ({e}); building locally instead.")
+        return None
+
+    commit_dir(tmp_dir, index_dir)
+    print(f"⬇️ Pulled index snapshot {version} in {time.perf_counter() - start:.2f}s")
+    return meta
+
+
+# ------------------ CLI ------------------ #
+if __name__ == "__main__":
+    import sys
+
+    import vector
+    from embed_cache import EMBED_DIM, EMBED_MODEL
+
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if cmd == "build":
+        if vector.load_vector_store() is None:
+            sys.exit("No documents indexed; nothing to publish.")
+        if vector.index_version() and "--force" not in sys.argv:
+            sys.exit(f"Index unchanged since snapshot {vector.index_version()}; nothing to publish (--force to republish).")
+        publish(vector.VECTOR_STORE_PATH, vector._load_hashes(), EMBED_MODEL, EMBED_DIM)
+    elif cmd == "pull":
+        meta = pull_latest(vector.VECTOR_STORE_PATH, EMBED_MODEL, EMBED_DIM)
+        print(json.dumps({k: meta[k] for k in ("version", "created")} if meta else None))
+    elif cmd == "list":
+        store = get_store()
+        current = latest_version(store)
+        for v in store.versions():
+            print(("* " if v == current else "  ") + v)
+    else:
+        sys.exit(f"unknown command {cmd!r}; expected build | pull | list")
@@ -1,39 +1,102 @@
 import os
 import json
 import hashlib
+import itertools
 import shutil
-from typing import Dict, List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 import google.auth
 from google.cloud import storage
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+import numpy as np
+from openai import OpenAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import snapshot
+from bm25 import BM25Index, reciprocal_rank_fusion
+from index_store import MmapIndex, commit_dir, remove_dir, stage_dir
+from embed_cache import EMBED_DIM, EMBED_MODEL, get_cache
+from embeddings import embed_batched
 
 # ------------------ CONFIG ------------------ #
 BUCKET_NAME = "msss-text-files"
 DATA_DIR = "data"
 VECTOR_STORE_PATH = "faiss_index"
 HASH_FILE = "file_hashes.json"
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "8"))
+MANIFEST_NAME = "chunk_manifest.json"
+MANIFEST_FILE = os.path.join(VECTOR_STORE_PATH, MANIFEST_NAME)
 
 _VECTOR_CACHE = {}
+_GENERATIONS = itertools.count(1)  # bumped whenever a different store is published
+_LOAD_LOCK = threading.Lock()     # one sync/update at a time
+_EMBEDDINGS = None
 
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
 
 # ------------------ Embeddings ------------------ #
+class OpenAIBatchEmbeddings(Embeddings):
+    """Index-build embedder: token-packed, concurrent, governed requests via embeddings.embed_batched."""
+
+    def __init__(self, model: str = EMBED_MODEL, dim: int = EMBED_DIM):
+        self.client = OpenAI(max_retries=0)  # retries go through the governor (embed_batched)
+        self.model = model
+        self.dim = dim
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return embed_batched(self.client, self.model, texts, self.dim)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedder with the shared on-disk cache; only misses reach the API."""
+
+    def __init__(self, inner: Embeddings, cache):
+        self.inner = inner
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            fresh = self.inner.embed_documents([texts[i] for i in missing])
+            self.cache.put_many([texts[i] for i in missing], fresh)
+            for i, v in zip(missing, fresh):
+                vectors[i] = v
+        return [list(map(float, v)) for v in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
 def _get_embeddings():
-    return OpenAIEmbeddings(model="text-embedding-3-small")
+    global _EMBEDDINGS
+    if _EMBEDDINGS is None:
+        _EMBEDDINGS = CachedEmbeddings(OpenAIBatchEmbeddings(), get_cache())
+    return _EMBEDDINGS
 
 
 # ------------------ Text Split ------------------ #
-def _split_text(text: str) -> List[Document]:
+def _split_text(text: str, source: Optional[str] = None) -> List[Document]:
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=1200,
         chunk_overlap=150
     )
-    return [Document(page_content=chunk) for chunk in splitter.split_text(text)]
+    return [
+        Document(page_content=chunk, metadata={"source": source, "hash": _hash(chunk)})
+        for chunk in splitter.split_text(text)
+    ]
+
+
+def _source_name(name: str) -> str:
+    """Normalise 'fees' / 'fees.txt' to the source key stored in chunk metadata."""
+    return name if name.endswith(".txt") else name + ".txt"
 
 
 # ------------------ Hash Utils ------------------ #
@@ -41,18 +104,44 @@ def _hash(text: str):
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
-def _load_hashes() -> Dict[str, str]:
+def _load_hashes() -> Dict[str, Dict[str, str]]:
     if os.path.exists(HASH_FILE):
         with open(HASH_FILE, "r") as f:
             return json.load(f)
     return {}
 
 
-def _save_hashes(data: Dict[str, str]):
+def _save_hashes(data: Dict[str, Dict[str, str]]):
     with open(HASH_FILE, "w") as f:
         json.dump(data, f, indent=2)
 
 
+# ------------------ Chunk Manifest ------------------ #
+# {file: {chunk_sha256: vector_id}} for everything currently in the FAISS index.
+def _chunk_id(source: str, digest: str) -> str:
+    return f"{source}:{digest}"
+
+
+def _load_manifest() -> Optional[Dict[str, Dict[str, str]]]:
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, "r") as f:
+            return json.load(f)
+    return None
+
+
+def _save_manifest(data: Dict[str, Dict[str, str]], index_dir: str):
+    with open(os.path.join(index_dir, MANIFEST_NAME), "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def _build_manifest(docs: Iterable[Document]) -> Dict[str, Dict[str, str]]:
+    manifest: Dict[str, Dict[str, str]] = {}
+    for doc in docs:
+        source, digest = doc.metadata["source"], doc.metadata["hash"]
+        manifest.setdefault(source, {})[digest] = _chunk_id(source, digest)
+    return manifest
+
+
 # ------------------ GCP Storage Client ------------------ #
 def get_storage_client():
     credentials, project = google.auth.default()
@@ -60,7 +149,26 @@ def get_storage_client():
 
 
 # ------------------ Sync Bucket Files ------------------ #
+def _blob_fingerprint(blob) -> Dict[str, str]:
+    # Listing metadata only: generation changes on every overwrite, md5 on every content change.
+    return {"generation": str(blob.generation), "md5": blob.md5_hash or ""}
+
+
+def _download(blob) -> str:
+    local_path = os.path.join(DATA_DIR, blob.name)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    tmp_path = local_path + ".part"
+    blob.download_to_filename(tmp_path)
+    os.replace(tmp_path, local_path)
+    return blob.name
+
+
 def sync_bucket_files_to_local() -> bool:
+    """
+    Mirror the bucket's .txt files into DATA_DIR. Change detection uses the
+    listing's generation/md5, so an unchanged bucket costs one list call;
+    changed blobs are downloaded in parallel.
+    """
     print(">>> Syncing bucket files...")
     client = get_storage_client()
     bucket = client.bucket(BUCKET_NAME)
@@ -68,35 +176,36 @@ def sync_bucket_files_to_local() -> bool:
     old_hashes = _load_hashes()
     new_hashes = {}
     changed = False
-    current_files = set()
+    to_fetch = []
 
-    # Add/update files
     for blob in bucket.list_blobs():
-        if not blob.name.endswith(".txt"):
-            continue
-
-        current_files.add(blob.name)
-        content = blob.download_as_text()
-        digest = _hash(content)
-        new_hashes[blob.name] = digest
+        if not blob.name.endswith(".txt") or blob.name.startswith("_"):
+            continue  # _-prefixed blobs (e.g. _dashboard_password.txt) are app state, not documents
+        fingerprint = _blob_fingerprint(blob)
+        new_hashes[blob.name] = fingerprint
         local_path = os.path.join(DATA_DIR, blob.name)
+        if old_hashes.get(blob.name) != fingerprint or not os.path.exists(local_path):
+            to_fetch.append(blob)
 
-        if old_hashes.get(blob.name) != digest:
-            with open(local_path, "w", encoding="utf-8") as f:
-                f.write(content)
-            changed = True
-            print(f"⬇️ Updated → {blob.name}")
+    # Add/update files
+    if to_fetch:
+        workers = min(SYNC_WORKERS, len(to_fetch))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gcs-sync") as pool:
+            for name in pool.map(_download, to_fetch):
+                print(f"⬇️ Updated → {name}")
+        changed = True
 
     # Delete removed files locally
     for local_file in os.listdir(DATA_DIR):
-        if local_file.endswith(".txt") and local_file not in current_files:
+        if local_file.endswith(".txt") and local_file not in new_hashes:
             os.remove(os.path.join(DATA_DIR, local_file))
             changed = True
             print(f"🗑 Removed → {local_file}")
 
-    if changed:
+    if changed or new_hashes != old_hashes:
         _save_hashes(new_hashes)
-        print("⚠️ Changes detected → will rebuild FAISS")
+    if changed:
+        print("⚠️ Changes detected → will update FAISS")
     else:
         print("✔ No changes detected")
 
@@ -105,8 +214,7 @@ def sync_bucket_files_to_local() -> bool:
 
 # ------------------ Reset FAISS Index ------------------ #
 def _reset_index():
-    if os.path.exists(VECTOR_STORE_PATH):
-        shutil.rmtree(VECTOR_STORE_PATH)
+    remove_dir(VECTOR_STORE_PATH)
     _VECTOR_CACHE.clear()
     print("🧨 FAISS index cleared")
 
@@ -114,48 +222,203 @@ def _reset_index():
 # ------------------ Load Documents ------------------ #
 def load_all_files() -> List[Document]:
     docs = []
-    for file in os.listdir(DATA_DIR):
+    for file in sorted(os.listdir(DATA_DIR)):
         if file.endswith(".txt"):
             path = os.path.join(DATA_DIR, file)
             with open(path, "r", encoding="utf-8") as f:
-                docs.extend(_split_text(f.read()))
+                docs.extend(_split_text(f.read(), source=file))
     return docs
 
 
-# ------------------ Main Loader ------------------ #
-def load_vector_store():
-    global _VECTOR_CACHE
+# ------------------ Incremental Update ------------------ #
+def _apply_changes(vs: Optional[MmapIndex], manifest: Dict[str, Dict[str, str]], docs: List[Document]):
+    """
+    Bring the on-disk index in line with `docs` using the chunk manifest: vectors of
+    unchanged chunks are copied from `vs`, only chunks whose (file, sha256) is new
+    are embedded, and the index, chunk store, manifest and snapshot meta are written
+    to a staged directory that replaces the live one in one step. Returns
+    (store, new_manifest, changed).
+    """
+    wanted: Dict[str, Document] = {}
+    for doc in docs:
+        wanted.setdefault(_chunk_id(doc.metadata["source"], doc.metadata["hash"]), doc)
+
+    existing = {vid for chunks in manifest.values() for vid in chunks.values()}
+    to_add = [vid for vid in wanted if vid not in existing]
+    to_delete = [vid for vid in existing if vid not in wanted]
+    if vs is not None and not to_add and not to_delete:
+        return vs, _build_manifest(wanted.values()), False
+
+    kept = {}
+    if vs is not None:
+        kept = {vid: vec for vid, vec in zip(vs.ids(), vs.vectors()) if vid in wanted}
+    fresh = [vid for vid in wanted if vid not in kept]
+    if vs is None:
+        print(f"🛠 Building index ({len(wanted)} chunks)...")
+    if fresh:
+        for vid, vec in zip(fresh, _get_embeddings().embed_documents([wanted[v].page_content for v in fresh])):
+            kept[vid] = vec
+    if vs is not None:
+        print(f"➖ Removed {len(to_delete)} stale chunks, ➕ embedded {len(fresh)} new chunks")
+
+    ids = list(wanted)
+    records = [
+        {"id": vid, "source": wanted[vid].metadata["source"], "hash": wanted[vid].metadata["hash"],
+         "text": wanted[vid].page_content}
+        for vid in ids
+    ]
+    manifest = _build_manifest(wanted.values())
+    staged = stage_dir(VECTOR_STORE_PATH)
+    try:
+        MmapIndex.write(staged, records, np.asarray([kept[vid] for vid in ids], dtype=np.float32))
+        _save_manifest(manifest, staged)
+        # The local index moves past any published snapshot; remember which one it
+        # started from so the next refresh doesn't pull (and re-diff) that snapshot again.
+        snapshot.mark_local_changes(VECTOR_STORE_PATH, staged)
+        commit_dir(staged, VECTOR_STORE_PATH)
+    except BaseException:
+        shutil.rmtree(staged, ignore_errors=True)
+        raise
+    return MmapIndex(VECTOR_STORE_PATH), manifest, True
+
+
+# ------------------ Snapshots ------------------ #
+def _pull_snapshot(current: Optional[str]) -> Optional[str]:
+    """Bring VECTOR_STORE_PATH to the published LATEST snapshot; returns its version."""
+    if not snapshot.enabled():
+        return None
+    try:
+        latest = snapshot.latest_version()
+        if latest is None or latest == current:
+            return current
+        meta = snapshot.pull_latest(VECTOR_STORE_PATH, EMBED_MODEL, EMBED_DIM)
+        return meta["version"] if meta else None
+    except Exception as e:
+        print(f"⚠️ Snapshot pull failed ({e}); using the local index")
+        return None
 
-    changed = sync_bucket_files_to_local()
-    if changed:
-        _reset_index()
 
-    if not changed and "retriever" in _VECTOR_CACHE:
-        print("✔ Serving from memory cache")
-        return _VECTOR_CACHE["retriever"]
+# ------------------ Main Loader ------------------ #
+def load_vector_store(progress: Optional[Callable[[str], None]] = None):
+    """
+    Sync the bucket and bring the shared index up to date, starting from the
+    latest published snapshot when there is a newer one. The new store is only
+    published to searches once it is complete. `progress` receives stage names.
+    """
+    report = progress or (lambda stage: None)
+    with _LOAD_LOCK:
+        report("syncing")
+        changed = sync_bucket_files_to_local()
+
+        current = _VECTOR_CACHE.get("version")
+        report("pulling")
+        version = _pull_snapshot(current)
+        if version != current and version is not None:
+            _VECTOR_CACHE.pop("store", None)  # reload from the pulled files below
+        elif not changed and "store" in _VECTOR_CACHE:
+            print("✔ Serving from memory cache")
+            report("ready")
+            return _VECTOR_CACHE["store"]
+
+        vs = _VECTOR_CACHE.get("store")
+        manifest = _load_manifest()
+        if vs is None and manifest is not None and MmapIndex.exists(VECTOR_STORE_PATH):
+            report("loading")
+            print("📂 Opening index from disk (mmap)...")
+            try:
+                vs = MmapIndex(VECTOR_STORE_PATH)
+                meta = snapshot.read_local_meta(VECTOR_STORE_PATH)
+                version = meta["version"] if meta else None
+            except Exception as e:
+                print(f"⚠️ Local index unreadable ({e}); rebuilding")
+        if vs is None:
+            # No manifest, an older pickled LangChain index or an unreadable one
+            # → full build (cheap with a warm embedding cache).
+            _reset_index()
+            manifest = None
 
-    if not os.path.exists(VECTOR_STORE_PATH):
-        print("🛠 Rebuilding FAISS index...")
         docs = load_all_files()
         if not docs:
             print("⚠️ No documents found.")
+            _reset_index()
+            report("ready")
             return None
-        vs = FAISS.from_documents(docs, _get_embeddings())
-        vs.save_local(VECTOR_STORE_PATH)
-    else:
-        print("📂 Loading FAISS index from disk...")
-        vs = FAISS.load_local(
-            VECTOR_STORE_PATH,
-            _get_embeddings(),
-            allow_dangerous_deserialization=True,
-        )
-
-    retriever = vs.as_retriever(search_kwargs={"k": 3})
-    _VECTOR_CACHE["retriever"] = retriever
-    print("✅ Vector store ready.")
-    return retriever
-
-
-# ------------------ CLI Run Test ------------------ #
-if __name__ == "__main__":
-    load_vector_store()
+
+        report("indexing")
+        vs, manifest, dirty = _apply_changes(vs, manifest or {}, docs)
+        if dirty:
+            version = None
+
+        sources = {source: len(chunks) for source, chunks in manifest.items()}
+        if _VECTOR_CACHE.get("store") is vs:
+            lexical, generation = _VECTOR_CACHE["lexical"], _VECTOR_CACHE["generation"]
+        else:
+            lexical, generation = BM25Index.from_chunks(vs.chunks), next(_GENERATIONS)
+        _VECTOR_CACHE.update(store=vs, lexical=lexical, sources=sources, version=version, generation=generation)
+        print(f"✅ Vector store ready ({len(sources)} files, {len(vs)} chunks, snapshot {version or 'local'}).")
+        report("ready")
+        return vs
+
+
+# ------------------ Query ------------------ #
+def index_version() -> Optional[str]:
+    """Snapshot version the live index matches, or None if it was built/updated locally."""
+    return _VECTOR_CACHE.get("version")
+
+
+def index_key() -> Optional[str]:
+    """Changes whenever the live index contents change (snapshot pull or local update); None with no index."""
+    if "store" not in _VECTOR_CACHE:
+        return None
+    return f"{_VECTOR_CACHE['generation']}:{_VECTOR_CACHE.get('version') or 'local'}"
+
+
+def list_sources() -> Dict[str, int]:
+    """Files in the loaded index mapped to their chunk counts."""
+    return dict(_VECTOR_CACHE.get("sources", {}))
+
+
+def _source_filter(sources: Optional[Iterable[str]]):
+    return {_source_name(s) for s in sources} if sources else None
+
+
+def lexical_search(query: str, k: int = 3, sources: Optional[Iterable[str]] = None) -> Tuple[List[Document], bool]:
+    """
+    BM25 search over the same chunks, no embeddings call. The flag is True when
+    the top hit is confident enough to answer from without a vector search.
+    """
+    vs, lexical = _VECTOR_CACHE.get("store"), _VECTOR_CACHE.get("lexical")
+    if vs is None or lexical is None or not query:
+        return [], False
+    wanted = _source_filter(sources)
+    accept = (lambda row: lexical.sources[row] in wanted) if wanted else None
+    hits = lexical.search(query, k=k, accept=accept)
+    return [vs.document(row) for row, _ in hits], lexical.confident(query, hits)
+
+
+def search(
+    query: str,
+    k: int = 3,
+    sources: Optional[Iterable[str]] = None,
+    embedding: Optional[List[float]] = None,
+) -> List[Document]:
+    """
+    Hybrid search over the shared index: vector and BM25 candidates merged with
+    reciprocal rank fusion.
+    Pass `sources` (file names, with or without .txt) to restrict hits to those files,
+    and `embedding` when the caller already embedded `query` (skips the embeddings call).
+    """
+    vs, lexical = _VECTOR_CACHE.get("store"), _VECTOR_CACHE.get("lexical")
+    if vs is None or not query:
+        return []
+    if embedding is None:
+        embedding = _get_embeddings().embed_query(query)
+    wanted = _source_filter(sources)
+    fetch_k = max(20, k * 10)
+    vector_rows = vs.search_rows(embedding, k=fetch_k, accept=(lambda rec: rec["source"] in wanted) if wanted else None,
+                                 fetch_k=fetch_k)
+    lexical_rows = []
+    if lexical is not None:
+        accept = (lambda row: lexical.sources[row] in wanted) if wanted else None
+        lexical_rows = [row for row, _ in lexical.search(query, k=fetch_k, accept=accept)]
+    return [vs.document(row) for row in reciprocal_rank_fusion(vector_rows, lexical_rows)[:k]]